@@ -0,0 +1,240 @@
+# app/api.py - HEADLESS ASYNC HTTP API FOR THE COMPANION ENGINE
+# Same turn pipeline as main.py (crisis check -> run_turn -> memory) behind
+# FastAPI, so the Streamlit UI is just one client and load tests can hit the
+# engine directly. Turns run in worker threads (SQLite and the LLM client are
+# blocking); a semaphore bounds how many run at once, and when the waiting
+# line is full new turns get 429 instead of piling up.
+#
+# Run from emotional_companion/app:
+#   uvicorn api:app --port 8000
+#   curl -X POST localhost:8000/sessions/alex/turns -H 'Content-Type: application/json' \
+#        -d '{"message": "I feel lonely today"}'
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from detectors import classify
+from llm_agent import run_turn, stream_analyze_and_respond
+from llm_client import registry as llm_registry
+from memory_manager import load_user_profile
+from metrics import inc, metrics
+from safety import safety_response
+from router import router
+from scheduler import scheduler
+from summariser import summariser
+from warmup import warmup
+
+# Turns in progress at once; defaults to what Ollama itself runs in parallel
+API_CONCURRENCY = int(os.getenv("INNER_VOICE_API_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+API_QUEUE_SIZE = int(os.getenv("INNER_VOICE_API_QUEUE", "32"))    # waiting turns before 429
+RETRY_AFTER = "2"                                                  # seconds, sent with 429
+MAX_SESSIONS = 10000                                               # turn counters kept in memory
+
+
+class TurnRequest(BaseModel):
+    message: str
+    user_id: Optional[str] = None   # defaults to the session id
+
+
+class TurnResponse(BaseModel):
+    response: str
+    emotion: Optional[str]
+    path: str
+    turn: int
+
+
+# ========================
+# ADMISSION (BOUNDED CONCURRENCY + BACKPRESSURE)
+# ========================
+class Admission:
+    """At most `limit` turns run; at most `queue_size` wait; the rest are refused."""
+
+    def __init__(self, limit: int = API_CONCURRENCY, queue_size: int = API_QUEUE_SIZE):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.waiting = 0
+        self.active = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        return self._slots
+
+    async def acquire(self) -> None:
+        slots = self._semaphore()
+        if slots.locked() and self.waiting >= self.queue_size:
+            inc("api_rejected")
+            raise HTTPException(429, "Too many turns in progress, try again shortly.",
+                                headers={"Retry-After": RETRY_AFTER})
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore().release()
+
+
+admission = Admission()
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Holds an admission slot until the response is over, however it ends: fully
+    sent, client gone mid-stream, or gone before the body generator ever ran
+    (a `finally` inside the generator would never run in that last case).
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release()
+
+
+# ========================
+# SESSIONS
+# ========================
+_turns: "OrderedDict[str, int]" = OrderedDict()
+_turns_lock = threading.Lock()
+
+
+def _next_turn(session_id: str) -> int:
+    with _turns_lock:
+        count = _turns.pop(session_id, 0) + 1
+        _turns[session_id] = count
+        while len(_turns) > MAX_SESSIONS:
+            _turns.popitem(last=False)
+        return count
+
+
+def _user_summary(user_id: str) -> str:
+    profile = load_user_profile(user_id)
+    summary = ""
+    if profile.get("name"):
+        summary += f"Name: {profile['name']}. "
+    if profile.get("age"):
+        summary += f"Age: {profile['age']}. "
+    return summary or "First-time user."
+
+
+def _message(request: TurnRequest) -> str:
+    message = request.message.strip()
+    if not message:
+        raise HTTPException(422, "message must not be empty")
+    return message
+
+
+# ========================
+# ROUTES
+# ========================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    llm_registry.start_probe()
+    warmup.start()  # load the model now, not on the first turn
+    yield
+
+
+app = FastAPI(title="InnerCompanion engine", lifespan=lifespan)
+
+
+@app.post("/sessions/{session_id}/turns", response_model=TurnResponse)
+async def create_turn(session_id: str, request: TurnRequest) -> TurnResponse:
+    message = _message(request)
+    user_id = request.user_id or session_id
+    signals = classify(message)
+    if signals.crisis:
+        inc("safety_crisis")
+        return TurnResponse(response=safety_response(), emotion="crisis", path="safety",
+                            turn=_next_turn(session_id))
+
+    await admission.acquire()
+    try:
+        # Counted once admitted: a 429 the client retries must not move the session on
+        turn = _next_turn(session_id)
+        summary = await run_in_threadpool(_user_summary, user_id)
+        result = await run_in_threadpool(run_turn, message, summary, turn, signals, user_id)
+    finally:
+        admission.release()
+    return TurnResponse(response=result.response, emotion=result.emotion, path=result.path, turn=turn)
+
+
+@app.post("/sessions/{session_id}/turns/stream")
+async def stream_turn(session_id: str, request: TurnRequest) -> StreamingResponse:
+    """NDJSON: {"delta": ...} lines as the reply is generated, then one {"done": true, ...} line."""
+    message = _message(request)
+    user_id = request.user_id or session_id
+    signals = classify(message)
+    if signals.crisis:
+        inc("safety_crisis")
+        done = {
+            "done": True, "response": safety_response(), "emotion": "crisis", "path": "safety",
+            "turn": _next_turn(session_id),
+        }
+        return StreamingResponse(iter([json.dumps(done) + "\n"]), media_type="application/x-ndjson")
+
+    # Admit before the response starts, so a full queue is still a plain 429
+    await admission.acquire()
+    try:
+        turn = _next_turn(session_id)
+
+        async def lines():
+            summary = await run_in_threadpool(_user_summary, user_id)
+            stream = stream_analyze_and_respond(message, summary, turn, signals, user_id)
+            async for piece in iterate_in_threadpool(iter(stream)):
+                yield json.dumps({"delta": piece}) + "\n"
+            yield json.dumps({
+                "done": True, "response": stream.response, "emotion": stream.emotion,
+                "path": stream.path, "turn": turn,
+            }) + "\n"
+
+        return AdmittedStreamingResponse(lines(), media_type="application/x-ndjson")
+    except BaseException:
+        admission.release()
+        raise
+
+
+@app.get("/healthz")
+async def health() -> dict:
+    return {
+        "ollama": llm_registry.status(),
+        "scheduler": scheduler.stats(),
+        "summaries": summariser.stats(),
+        "warmup": warmup.stats(),
+        "routing": router.stats(),
+        "turns_active": admission.active,
+        "turns_waiting": admission.waiting,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus() -> str:
+    return metrics.to_prometheus()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.getenv("INNER_VOICE_API_HOST", "127.0.0.1"),
+        port=int(os.getenv("INNER_VOICE_API_PORT", "8000")),
+    )
@@ -0,0 +1,478 @@
+# app/benchmark.py - REPLAY + LATENCY BENCHMARK FOR THE TURN PIPELINE
+# Replays scripted multi-turn conversations through the same pipeline as
+# main.py (crisis check -> analyze_and_respond -> memory) from many workers at
+# once, and reports throughput plus p50/p95/p99 latency per path.
+#
+# Run from emotional_companion/app:
+#   python benchmark.py --backend offline --synthetic 200 --workers 8
+#   python benchmark.py --backend fake --save bench_baseline.json
+#   python benchmark.py --backend fake --compare bench_baseline.json
+#   python benchmark.py --backend ollama --workers 2
+#   python benchmark.py --backend ollama --record cassettes/bench.jsonl
+#   python benchmark.py --replay cassettes/bench.jsonl   # same turns, no model, seconds
+#   python benchmark.py --prompt-eval                  # prompt layout vs the fake server
+#   python benchmark.py --prompt-eval --base-url http://localhost:11434
+#   python benchmark.py --detectors                    # exact vs typo-tolerant classify
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SCENARIO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bench_scenarios.jsonl")
+
+
+# ========================
+# CONVERSATIONS
+# ========================
+def load_scenarios(path: str = SCENARIO_FILE) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+OPENERS = [
+    "Hii", "I am feeling lonely", "I feel so sad today", "I'm really anxious about tomorrow",
+    "I am so tired of everything", "I'm angry at my friend", "Today was my birthday and I'm happy",
+]
+DETAILS = [
+    "No one texts me back anymore.", "I failed my maths test again.", "My parents shouted at me.",
+    "We had a big fight and he left.", "I can't focus on anything.", "I keep overthinking at night.",
+    "They took a loan for my studies.", "My best friend stopped talking to me.",
+]
+COMFORT = ["Just comfort me.", "Please encourage me.", "I just need support.", "Help me feel better."]
+CLOSINGS = ["Thank you, that's all.", "That's enough, I don't want to talk anymore.", "Let's end this."]
+HIGH_RISK = ["Someone is threatening to leak my photos.", "My ex is blackmailing me."]
+CRISIS = ["I want to die.", "I think about ending my life."]
+
+
+def synthetic_conversations(count: int, seed: int = 7) -> List[dict]:
+    rng = random.Random(seed)
+    conversations = []
+    for n in range(count):
+        turns = [rng.choice(OPENERS)]
+        turns += rng.sample(DETAILS, rng.randint(1, 4))
+        roll = rng.random()
+        if roll < 0.05:
+            turns.append(rng.choice(CRISIS))
+        elif roll < 0.10:
+            turns.append(rng.choice(HIGH_RISK))
+        if rng.random() < 0.5:
+            turns.append(rng.choice(COMFORT))
+        turns.append(rng.choice(CLOSINGS))
+        conversations.append({"name": f"synthetic-{n}", "turns": turns})
+    return conversations
+
+
+# ========================
+# FAKE LLM BACKEND
+# ========================
+class FakeChain:
+    """
+    Stand-in for prompt | llm | parser with a controllable speed. Replies are
+    built from the offline templates, so they carry a valid [EMOTION=...] tag.
+    """
+
+    def __init__(self, first_token_delay: float = 0.05, tokens_per_sec: float = 200.0, fail_rate: float = 0.0):
+        self.first_token_delay = first_token_delay
+        self.tokens_per_sec = tokens_per_sec
+        self.fail_rate = fail_rate
+
+    def _tokens(self, input_data: dict) -> List[str]:
+        from llm_agent import generate_offline_response
+
+        if random.random() < self.fail_rate:
+            raise ConnectionError("fake LLM: injected failure")
+        raw, _ = generate_offline_response(input_data["message"], 1)
+        return [w + " " for w in raw.split(" ")]
+
+    def stream(self, input_data: dict) -> Iterator[str]:
+        tokens = self._tokens(input_data)
+        time.sleep(self.first_token_delay)
+        for token in tokens:
+            time.sleep(1.0 / self.tokens_per_sec)
+            yield token
+
+    def invoke(self, input_data: dict) -> str:
+        return "".join(self.stream(input_data))
+
+
+def setup_backend(
+    backend: str,
+    memory_dir: str,
+    fake: Optional[dict] = None,
+    cache: bool = True,
+    cassette_mode: str = "off",
+    cassette_path: Optional[str] = None,
+    base_url: Optional[str] = None,
+) -> None:
+    """Configure this process (also used as the process-pool initializer)."""
+    import memory_manager
+    import response_cache
+    import summariser
+    from cassette import cassette
+    from llm_client import registry
+
+    memory_manager.configure(memory_dir)
+    response_cache.CACHE_ENABLED = cache
+    if cassette_mode != "off":
+        # Every prompt must come out the same on record and replay
+        response_cache.CACHE_ENABLED = False
+        summariser.SUMMARIES_ENABLED = False
+        cassette.configure(cassette_path, cassette_mode)
+    if backend == "offline":
+        registry.use_backend(offline=True)
+    elif backend == "fake":
+        registry.use_backend(FakeChain(**(fake or {})))
+    elif backend == "ollama":
+        from warmup import warmup
+
+        if base_url:
+            registry.configure(base_url)  # before warming, so the server under test gets primed
+        registry.use_backend()
+        warmup.warm()  # measure turns, not the model load
+    else:
+        raise ValueError(f"unknown backend: {backend}")
+
+
+# ========================
+# TURN PIPELINE (same order as main.py)
+# ========================
+def run_conversation(conversation: dict, user_id: str) -> List[Tuple[str, float]]:
+    from detectors import classify
+    from llm_agent import run_turn
+    from safety import safety_response
+
+    samples = []
+    for turn_count, message in enumerate(conversation["turns"], start=1):
+        start = time.perf_counter()
+        signals = classify(message)
+        if signals.crisis:
+            safety_response()
+            path = "safety"
+        else:
+            path = run_turn(message, "First-time user.", turn_count, signals, user_id).path
+        samples.append((path, time.perf_counter() - start))
+    return samples
+
+
+def _run_indexed(args: Tuple[int, dict]) -> List[Tuple[str, float]]:
+    index, conversation = args
+    return run_conversation(conversation, f"bench-{index}")
+
+
+# ========================
+# REPORT
+# ========================
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarise(samples: List[Tuple[str, float]], wall: float) -> Dict[str, dict]:
+    by_path: Dict[str, List[float]] = {"all": [lat for _, lat in samples]}
+    for path, lat in samples:
+        by_path.setdefault(path, []).append(lat)
+    report = {}
+    for path, lats in sorted(by_path.items()):
+        report[path] = {
+            "turns": len(lats),
+            "p50_ms": round(percentile(lats, 50) * 1000, 3),
+            "p95_ms": round(percentile(lats, 95) * 1000, 3),
+            "p99_ms": round(percentile(lats, 99) * 1000, 3),
+            "max_ms": round(max(lats) * 1000, 3),
+        }
+    report["all"]["throughput_tps"] = round(len(samples) / wall, 2) if wall else 0.0
+    return report
+
+
+def print_report(report: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    print(f"{'path':<10}{'turns':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for path, row in report.items():
+        line = (
+            f"{path:<10}{row['turns']:>8}{row['p50_ms']:>11.2f}"
+            f"{row['p95_ms']:>11.2f}{row['p99_ms']:>11.2f}{row['max_ms']:>11.2f}"
+        )
+        old = (baseline or {}).get(path)
+        if old:
+            line += f"   p95 vs baseline: {row['p95_ms'] - old['p95_ms']:+.2f} ms"
+        print(line)
+    print(f"throughput: {report['all']['throughput_tps']} turns/s")
+
+
+# ========================
+# PROMPT-EVAL (PREFIX REUSE)
+# ========================
+# The layout used before the stable prefix: per-turn text sat between the
+# system prompt and the rules reminder, so only the system prompt was reusable.
+LEGACY_TURN = """
+Current phase: {phase}
+
+User is talking about ONE situation.
+
+Things they told you before that may matter here (use only what helps, never invent more):
+{memory}
+
+User says: {message}
+"""
+
+
+def _layouts(message: str, phase: str, memory: str) -> Dict[str, str]:
+    from llm_agent import PROMPT_PREFIX, PROMPT_RULES, PROMPT_TURN, SYSTEM_PROMPT
+
+    fields = {
+        "examples": "", "phase": phase, "summary": "First-time user.", "memory": memory, "message": message,
+    }
+    return {
+        "legacy": "\n" + SYSTEM_PROMPT + "\n" + LEGACY_TURN.format(**fields) + "\n" + PROMPT_RULES,
+        "prefix": PROMPT_PREFIX + PROMPT_TURN.format(**fields),
+    }
+
+
+def measure_prompt_eval(base_url: str, model: str, messages: List[str]) -> Dict[str, dict]:
+    """
+    Send every message in both layouts and compare how much of each prompt
+    Ollama had to evaluate. The first call per layout also pays for the prefix.
+    """
+    from llm_client import LLMRegistry
+
+    client = LLMRegistry(base_url)
+    report = {}
+    for layout in ("legacy", "prefix"):
+        rows = [
+            client.measure_prompt_eval(_layouts(m, "understanding", "Nothing yet.")[layout], model)
+            for m in messages
+        ]
+        warm = rows[1:] or rows
+        report[layout] = {
+            "calls": len(rows),
+            "first_eval_tokens": rows[0]["prompt_eval_count"],
+            "first_eval_ms": round(rows[0]["prompt_eval_ms"], 3),
+            "warm_eval_tokens": round(sum(r["prompt_eval_count"] for r in warm) / len(warm), 1),
+            "warm_eval_ms": round(sum(r["prompt_eval_ms"] for r in warm) / len(warm), 3),
+        }
+    return report
+
+
+def print_prompt_eval(report: Dict[str, dict]) -> None:
+    print(f"{'layout':<10}{'calls':>7}{'first tok':>11}{'first ms':>11}{'warm tok':>11}{'warm ms':>11}")
+    for layout, row in report.items():
+        print(
+            f"{layout:<10}{row['calls']:>7}{row['first_eval_tokens']:>11}{row['first_eval_ms']:>11.2f}"
+            f"{row['warm_eval_tokens']:>11}{row['warm_eval_ms']:>11.2f}"
+        )
+
+
+def _prompt_eval_main(args) -> Dict[str, dict]:
+    from fake_ollama import FakeOllama
+    from llm_client import DEFAULT_MODEL
+
+    messages = [turn for conv in load_scenarios(args.scenarios) for turn in conv["turns"]]
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = FakeOllama().start()
+        base_url = server.base_url
+    try:
+        report = measure_prompt_eval(base_url, args.model or DEFAULT_MODEL, messages)
+    finally:
+        if server is not None:
+            server.stop()
+    print_prompt_eval(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"saved report to {args.save}")
+    return report
+
+
+# ========================
+# DETECTORS (EXACT VS FUZZY)
+# ========================
+def with_typo(message: str, rng: random.Random) -> str:
+    """One random edit (swap, drop, double or replace) inside a word of 6+ letters."""
+    words = message.split(" ")
+    long_words = [i for i, w in enumerate(words) if sum(c.isalpha() for c in w) >= 6]
+    if not long_words:
+        return message
+    i = rng.choice(long_words)
+    w = words[i]
+    pos = rng.randrange(1, len(w) - 1)
+    edit = rng.choice(["swap", "drop", "double", "replace"])
+    if edit == "swap":
+        w = w[:pos] + w[pos + 1] + w[pos] + w[pos + 2:]
+    elif edit == "drop":
+        w = w[:pos] + w[pos + 1:]
+    elif edit == "double":
+        w = w[:pos] + w[pos] + w[pos:]
+    else:
+        w = w[:pos] + rng.choice("aeioulnrst") + w[pos + 1:]
+    words[i] = w
+    return " ".join(words)
+
+
+# Correctly spelled sentences one edit away from a keyword; typo correction must
+# leave every one of them exactly as the exact matcher classifies it
+REAL_WORD_SENTENCES = [
+    "I think I overdone it at the gym",
+    "My mom overdone the rice",
+    "We drove past a homeless shelter",
+    "He exited the room quietly",
+    "The doctor excised the mole",
+    "My brother imitated my voice",
+    "The cat sleeps all day",
+    "It was a fabled old castle",
+    "The grader marked it late",
+    "What a lovely evening",
+    "I filed the papers today",
+    "The leaves are falling",
+    "We stared at the sacred river",
+]
+
+
+def real_word_false_alarms(sentences: List[str] = REAL_WORD_SENTENCES) -> List[str]:
+    """Sentences whose classification changes once typo correction is on."""
+    from detectors import classify
+
+    return [s for s in sentences if classify(s, fuzzy=True) != classify(s, fuzzy=False)]
+
+
+def measure_detectors(messages: List[str], seed: int = 7) -> Dict[str, dict]:
+    """Per-message classify() latency, and how often a typo changes the result."""
+    from detectors import classify
+
+    rng = random.Random(seed)
+    pairs = [(m, with_typo(m, rng)) for m in messages]
+    pairs = [(clean, typo) for clean, typo in pairs if clean != typo]
+    report = {}
+    for mode, fuzzy in (("exact", False), ("fuzzy", True)):
+        lats, same = [], 0
+        for clean, typo in pairs:
+            expected = classify(clean, fuzzy=False)
+            start = time.perf_counter()
+            got = classify(typo, fuzzy=fuzzy)
+            lats.append(time.perf_counter() - start)
+            same += got == expected
+        report[mode] = {
+            "messages": len(pairs),
+            "p50_us": round(percentile(lats, 50) * 1e6, 2),
+            "p99_us": round(percentile(lats, 99) * 1e6, 2),
+            "max_us": round(max(lats) * 1e6, 2) if lats else 0.0,
+            "typo_recall": round(same / len(pairs), 3) if pairs else 0.0,
+        }
+    return report
+
+
+def _detectors_main(args) -> Dict[str, dict]:
+    messages = [turn for conv in load_scenarios(args.scenarios) for turn in conv["turns"]]
+    synthetic = synthetic_conversations(max(args.synthetic, 200), args.seed)
+    messages += [turn for conv in synthetic for turn in conv["turns"]]
+    report = measure_detectors(messages, args.seed)
+    print(f"{'mode':<8}{'msgs':>7}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'same as clean':>15}")
+    for mode, row in report.items():
+        print(
+            f"{mode:<8}{row['messages']:>7}{row['p50_us']:>10.2f}{row['p99_us']:>10.2f}"
+            f"{row['max_us']:>10.2f}{row['typo_recall']:>15.1%}"
+        )
+    false_alarms = real_word_false_alarms()
+    report["fuzzy"]["false_alarms"] = len(false_alarms)
+    print(f"real words changed by typo correction: {len(false_alarms)}/{len(REAL_WORD_SENTENCES)}")
+    for sentence in false_alarms:
+        print(f"  {sentence!r}")
+    if false_alarms:
+        raise SystemExit(1)
+    return report
+
+
+# ========================
+# CLI
+# ========================
+def main(argv: Optional[List[str]] = None) -> Dict[str, dict]:
+    parser = argparse.ArgumentParser(description="Replay conversations through analyze_and_respond.")
+    parser.add_argument("--backend", choices=["offline", "fake", "ollama"], default="offline")
+    parser.add_argument("--scenarios", default=SCENARIO_FILE, help="JSONL of {name, turns}")
+    parser.add_argument("--repeat", type=int, default=10, help="times each scripted scenario is replayed")
+    parser.add_argument("--synthetic", type=int, default=0, help="extra generated conversations")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--memory-dir", default=None, help="defaults to a fresh temp dir")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--fake-ttft", type=float, default=0.05, help="fake backend first-token delay (s)")
+    parser.add_argument("--fake-tps", type=float, default=200.0, help="fake backend tokens per second")
+    parser.add_argument("--fake-fail-rate", type=float, default=0.0)
+    parser.add_argument("--save", help="write the report as baseline JSON")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    parser.add_argument("--record", metavar="CASSETTE", help="save every model reply to this cassette")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve model replies from this cassette")
+    parser.add_argument("--prompt-eval", action="store_true", help="compare prompt-eval cost of the prompt layouts")
+    parser.add_argument("--base-url", help="Ollama for --prompt-eval (default: a local fake server)")
+    parser.add_argument("--model", help="model for --prompt-eval")
+    parser.add_argument("--detectors", action="store_true", help="time exact vs typo-tolerant classify()")
+    args = parser.parse_args(argv)
+
+    if args.detectors:
+        return _detectors_main(args)
+
+    if args.prompt_eval:
+        return _prompt_eval_main(args)
+
+    conversations = load_scenarios(args.scenarios) * args.repeat
+    conversations += synthetic_conversations(args.synthetic, args.seed)
+    memory_dir = args.memory_dir or tempfile.mkdtemp(prefix="inner_voice_bench_")
+    fake = {
+        "first_token_delay": args.fake_ttft,
+        "tokens_per_sec": args.fake_tps,
+        "fail_rate": args.fake_fail_rate,
+    }
+    cassette_mode, cassette_path = ("replay", args.replay) if args.replay else (
+        ("record", args.record) if args.record else ("off", None)
+    )
+    setup_args = (args.backend, memory_dir, fake, not args.no_cache, cassette_mode, cassette_path)
+
+    if args.executor == "process":
+        pool = ProcessPoolExecutor(args.workers, initializer=setup_backend, initargs=setup_args)
+    else:
+        setup_backend(*setup_args)
+        pool = ThreadPoolExecutor(args.workers)
+
+    start = time.perf_counter()
+    with pool:
+        results = list(pool.map(_run_indexed, enumerate(conversations)))
+    wall = time.perf_counter() - start
+
+    samples = [s for conv in results for s in conv]
+    report = summarise(samples, wall)
+    report["meta"] = {
+        "backend": "replay" if args.replay else args.backend,
+        "conversations": len(conversations),
+        "workers": args.workers,
+        "executor": args.executor,
+        "wall_s": round(wall, 3),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report({k: v for k, v in report.items() if k != "meta"}, baseline)
+    if cassette_mode != "off" and args.executor == "thread":
+        from cassette import cassette
+
+        print(f"cassette: {cassette.stats()}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"saved baseline to {args.save}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
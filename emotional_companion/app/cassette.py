@@ -0,0 +1,141 @@
+# app/cassette.py - RECORD / REPLAY OF LLM CALLS
+# Wraps the turn chain so every model reply is saved under a hash of the fully
+# rendered prompt (plus model and generation variant), chunk by chunk, in an
+# append-only JSONL cassette. Replay serves the same chunks bit-exactly with no
+# model at all, so scripted conversations exercise the LLM path (phases,
+# comfort override, closing, tag parsing, persistence) in seconds, and engine
+# overhead can be profiled without model latency.
+#
+#   INNER_VOICE_CASSETTE_MODE=record INNER_VOICE_CASSETTE=cassettes/llm.jsonl streamlit run main.py
+#   python benchmark.py --backend fake --record cassettes/bench.jsonl
+#   python benchmark.py --replay cassettes/bench.jsonl --synthetic 2000
+#
+# Prompts must be reproducible for replay to hit: use a fresh memory dir, no
+# response cache and no background summaries (benchmark.py does this).
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from metrics import inc
+
+CASSETTE_MODES = ("off", "record", "replay")
+CASSETTE_MODE = os.getenv("INNER_VOICE_CASSETTE_MODE", "off")
+CASSETTE_FILE = os.getenv("INNER_VOICE_CASSETTE", os.path.join("cassettes", "llm.jsonl"))
+
+
+class CassetteMiss(KeyError):
+    """Replay found no recording for this prompt (the turn falls back offline)."""
+
+
+def prompt_key(model: str, variant: str, prompt: str) -> str:
+    text = f"{model}\x1f{variant}\x1f{prompt}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path: str = CASSETTE_FILE, mode: str = CASSETTE_MODE):
+        self._lock = threading.Lock()
+        self._tapes: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.configure(path, mode)
+
+    def configure(self, path: str, mode: str) -> None:
+        """Switch file and mode; an existing cassette is loaded (later lines win)."""
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"unknown cassette mode: {mode}")
+        with self._lock:
+            self.path, self.mode = path, mode
+            self._tapes = {}
+            if mode != "off" and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._tapes[entry["key"]] = entry["chunks"]
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def play(self, key: str) -> List[str]:
+        with self._lock:
+            chunks = self._tapes.get(key)
+            if chunks is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if chunks is None:
+            inc("cassette_miss")
+            raise CassetteMiss(key)
+        inc("cassette_hit")
+        return chunks
+
+    def record(self, key: str, chunks: List[str]) -> None:
+        line = json.dumps({"key": key, "chunks": chunks}, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._tapes.get(key) == chunks:
+                return
+            self._tapes[key] = chunks
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    def wrap(self, chain: Any, render: Callable[[dict], str], model: str, variant: str = "") -> Any:
+        """The chain to use for a turn: replayed, recording, or `chain` as is."""
+        if self.mode == "replay":
+            return CassetteChain(self, None, render, model, variant)
+        if self.mode == "record" and chain is not None:
+            return CassetteChain(self, chain, render, model, variant)
+        return chain
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "tapes": len(self._tapes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+class CassetteChain:
+    """stream/invoke like prompt | llm | parser, through the cassette."""
+
+    def __init__(self, cassette: Cassette, inner: Optional[Any], render: Callable[[dict], str],
+                 model: str, variant: str):
+        self.cassette = cassette
+        self.inner = inner
+        self.render = render
+        self.model = model
+        self.variant = variant
+
+    def stream(self, input_data: dict) -> Iterator[str]:
+        key = prompt_key(self.model, self.variant, self.render(input_data))
+        if self.inner is None:
+            yield from self.cassette.play(key)
+            return
+        chunks: List[str] = []
+        try:
+            for chunk in self.inner.stream(input_data):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The caller stopped early (tag complete); replay stops at the same chunk
+            self.cassette.record(key, chunks)
+            raise
+        self.cassette.record(key, chunks)
+
+    def invoke(self, input_data: dict) -> str:
+        return "".join(self.stream(input_data))
+
+
+cassette = Cassette()
@@ -0,0 +1,421 @@
+# app/detectors.py - SINGLE-PASS KEYWORD CLASSIFIER
+# All keyword tables used by safety.py and llm_agent.py live here, compiled once
+# at import into one Aho-Corasick automaton. Every message is lowercased and
+# scanned exactly once, no matter how many keywords the tables grow to.
+#
+# Misspellings ("linely", "stresed") are caught by a SymSpell-style deletion
+# index over the keyword vocabulary: tokens one or two typos away from a
+# keyword word are corrected, and the corrected text is scanned again. A token
+# that is itself an English word is never corrected ("overdone" stays
+# "overdone"). Crisis / high-risk keywords take a stricter rule: one typo at
+# most, and in a phrase only with the rest of the phrase typed exactly
+# ("i want to kil myself").
+import gzip
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+# ========================
+# KEYWORD TABLES
+# ========================
+CRISIS_KEYWORDS = [
+    "suicide", "kill myself", "end my life", "want to die", "hurt myself",
+    "i can't go on", "self harm", "overdose", "i'll kill myself"
+]
+
+HIGH_RISK_KEYWORDS = [
+    "blackmail", "blackmailing", "threaten", "threatening",
+    "leak my photo", "leak my photos", "leak my pic", "leak my pics",
+    "nude", "nudes",
+    "kill myself", "want to die", "suicide", "hurt myself",
+    "self harm", "self-harm",
+    "abuse", "abused", "rape", "molest", "stalk", "stalking"
+]
+
+COMFORT_PHRASES = [
+    "just comfort me",
+    "comfort me",
+    "i just want comfort",
+    "i just need comfort",
+    "i don't want more questions",
+    "stop asking questions",
+    "i just need support",
+    "i just need someone",
+    "make me feel better",
+    "help me feel better",
+    "i feel hopeless",
+    "i am tired of this",
+    "i am tired of everything",
+    "please encourage me",
+    "just give me some advice",
+]
+
+DISTRESS_WORDS = [
+    "failed", "failing", "fail in all", "all subjects",
+    "parents upset", "parents get upset",
+    "loan", "burden", "burden to them",
+    "disappointed", "disappointing",
+    "stress", "stressed", "overwhelmed",
+    "hopeless", "no hope", "tired of this", "tired of everything",
+    "useless", "waste", "good for nothing",
+]
+
+CLOSE_PHRASES = [
+    "that's enough",
+    "enough questions",
+    "stop asking questions",
+    "i don't want to talk more",
+    "i don't want to talk anymore",
+    "let's end this",
+    "end this",
+    "thank you, that's all",
+    "thank you thats all",
+]
+
+# school / exam related words; together with a scolding word they mean "sad"
+SCHOOL_WORDS = ["exam", "test", "marks", "grades", "failed", "fail", "low mark"]
+SCOLD_WORDS = ["scold", "shout", "yell", "angry", "disappointed"]
+
+# Checked in this order; the first emotion with a hit wins.
+EMOTION_KEYWORDS = {
+    "lonely": ["lonely", "alone", "left out"],
+    "sad": ["sad", "upset", "down", "bad", "hurt", "heartbroken"],
+    "anxious": ["anxious", "nervous", "worried", "scared", "panic"],
+    "angry": ["angry", "mad", "frustrated", "irritated", "annoyed"],
+    "tired": ["tired", "exhausted", "drained", "burned out", "sleepy"],
+    "happy": ["happy", "glad", "excited", "joyful", "grateful", "birthday"],
+}
+
+
+# ========================
+# AHO-CORASICK AUTOMATON
+# ========================
+class KeywordAutomaton:
+    """
+    Multi-pattern substring matcher. Built once from (keyword, label) pairs;
+    `labels_in(text)` walks the text a single time and returns every label
+    whose keyword occurs anywhere in it (overlapping matches included).
+    """
+
+    def __init__(self, table: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[Set[str]] = [set()]
+        for keyword, label in table:
+            self._add(keyword.lower(), label)
+        self._fail = self._link()
+        self._freeze()
+
+    def _add(self, keyword: str, label: str) -> None:
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._out.append(set())
+            state = nxt
+        self._out[state].add(label)
+
+    def _link(self) -> List[int]:
+        fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in self._goto[f]:
+                    f = fail[f]
+                fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[fail[nxt]]
+        return fail
+
+    def _freeze(self) -> None:
+        self._outputs: List[FrozenSet[str]] = [frozenset(o) for o in self._out]
+        del self._out
+
+    def labels_in(self, text: str) -> Set[str]:
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: Set[str] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+def _label_table() -> List[Tuple[str, str]]:
+    table = []
+    table += [(kw, "crisis") for kw in CRISIS_KEYWORDS]
+    table += [(kw, "high_risk") for kw in HIGH_RISK_KEYWORDS]
+    table += [(kw, "comfort") for kw in COMFORT_PHRASES]
+    table += [(kw, "distress") for kw in DISTRESS_WORDS]
+    table += [(kw, "close") for kw in CLOSE_PHRASES]
+    table += [(kw, "school") for kw in SCHOOL_WORDS]
+    table += [(kw, "scold") for kw in SCOLD_WORDS]
+    for emotion, words in EMOTION_KEYWORDS.items():
+        table += [(kw, f"emotion:{emotion}") for kw in words]
+    return table
+
+
+_AUTOMATON = KeywordAutomaton(_label_table())
+
+
+# ========================
+# FUZZY (TYPO-TOLERANT) LOOKUP
+# ========================
+FUZZY_MATCHING = os.getenv("INNER_VOICE_FUZZY", "1") != "0"
+
+# A false alarm on these labels sends the emergency reply, so their keywords
+# tolerate a single typo, and phrases only with their other words as context
+STRICT_LABELS = frozenset({"crisis", "high_risk"})
+
+ENGLISH_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "english_words.txt.gz")
+_VOWELS = "aeiouy"
+# (suffix, what it replaces) for inflections the word list doesn't spell out.
+# Only inflections: "-ly" or "-less" would make "linely" a word ("line" + "ly").
+_SUFFIXES = (
+    ("ies", "y"), ("ied", "y"), ("ier", "y"), ("iest", "y"),
+    ("s", ""), ("es", ""), ("ed", ""), ("ed", "e"), ("ing", ""), ("ing", "e"),
+    ("er", ""), ("er", "e"), ("ers", ""), ("ers", "e"), ("est", ""), ("est", "e"),
+)
+
+
+def _load_english_words(path: str = ENGLISH_WORDS_FILE) -> FrozenSet[str]:
+    if not os.path.exists(path):
+        return frozenset()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return frozenset(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+
+# Loaded with the automaton, so no classify() call (on the API's event loop) pays for it
+_ENGLISH_WORDS = _load_english_words()
+
+
+def _stems(word: str) -> Iterable[str]:
+    """`word` and the base words it may be an inflection of ("stopped" -> "stop")."""
+    yield word
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            stem = word[: -len(suffix)]
+            yield stem + replacement
+            # Doubled final consonant after a single vowel: "stopped", "sadder"
+            if (not replacement and len(stem) >= 4 and stem[-1] == stem[-2] and stem[-1] not in _VOWELS
+                    and stem[-3] in _VOWELS and stem[-4] not in _VOWELS):
+                yield stem[:-1]
+
+
+def is_english_word(token: str) -> bool:
+    """A dictionary word, or an inflected form of one."""
+    return any(stem in _ENGLISH_WORDS for stem in _stems(token))
+
+
+_TOKEN = re.compile(r"[a-z']+")
+
+
+def _max_edits(word: str) -> int:
+    """Typos tolerated for a vocabulary word: short words are too easy to confuse."""
+    if len(word) >= 9:
+        return 2
+    if len(word) >= 6:
+        return 1
+    return 0
+
+
+def _deletes(word: str, depth: int) -> Set[str]:
+    out = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps cost 1); > limit once it can't fit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class FuzzyIndex:
+    """
+    Deletion index: every vocabulary word is stored under each string reachable
+    by deleting up to its edit budget of characters. A token's own deletions
+    then find all candidates within that distance by hash lookups alone, and
+    each candidate is confirmed with a bounded edit distance.
+    """
+
+    def __init__(self, words: Iterable[str], strict: Iterable[str] = ()):
+        self.words = frozenset(words) | frozenset(strict)
+        self.strict = frozenset(strict)
+        self._by_delete: Dict[str, List[str]] = {}
+        for word in self.words:
+            for variant in _deletes(word, self._budget(word)):
+                self._by_delete.setdefault(variant, []).append(word)
+        self.correct = lru_cache(maxsize=65536)(self._correct)
+
+    def _budget(self, word: str) -> int:
+        return min(_max_edits(word), 1) if word in self.strict else _max_edits(word)
+
+    def _correct(self, token: str) -> Optional[str]:
+        """Closest vocabulary word within its edit budget, or None (also for real words)."""
+        if len(token) < 5 or token in self.words:
+            return None
+        candidates = set()
+        for variant in _deletes(token, 2 if len(token) >= 7 else 1):
+            candidates.update(self._by_delete.get(variant, ()))
+        best, best_distance = None, 3
+        for word in sorted(candidates):
+            if word[0] != token[0]:
+                continue  # typos rarely hit the first letter; this keeps "talking" from "stalking"
+            limit = self._budget(word)
+            distance = _edit_distance(token, word, limit)
+            if distance <= limit and distance < best_distance:
+                best, best_distance = word, distance
+        if best is not None and is_english_word(token):
+            return None  # a real word that merely looks like a keyword ("homeless", "sleeps")
+        return best
+
+    def corrected(self, text: str) -> Optional[str]:
+        """Lowercased text with typos replaced by vocabulary words; None if nothing changed."""
+        changed = False
+
+        def fix(match):
+            nonlocal changed
+            word = self.correct(match.group())
+            if word is None:
+                return match.group()
+            changed = True
+            return word
+
+        fixed = _TOKEN.sub(fix, text)
+        return fixed if changed else None
+
+
+def _vocabulary() -> Tuple[Set[str], Set[str]]:
+    """(ordinary words, strict words); strict ones come from one-word crisis / high-risk keywords."""
+    words, strict = set(), set()
+    for keyword, label in _label_table():
+        tokens = _TOKEN.findall(keyword.lower())
+        if label not in STRICT_LABELS:
+            words.update(w for w in tokens if _max_edits(w))
+        elif len(tokens) == 1 and _max_edits(tokens[0]):
+            strict.add(tokens[0])
+    return words, strict - words
+
+
+class PhraseTypos:
+    """
+    Multi-word crisis / high-risk keywords with one word mistyped. The other
+    words must be typed exactly (they are the context that makes "kil" mean
+    "kill"), and the mistyped one must be a single edit away. A real word
+    only counts as a typo if it is the keyword word with a doubled letter
+    or an apostrophe dropped ("kil", "cant"), never a different word
+    ("and my life", "want to dye").
+    """
+
+    def __init__(self, table: Iterable[Tuple[str, str]]):
+        self._by_word: Dict[Tuple[int, str], List[Tuple[Tuple[str, ...], str]]] = {}
+        seen = set()
+        for keyword, label in table:
+            words = tuple(_TOKEN.findall(keyword.lower()))
+            if len(words) < 2 or (words, label) in seen:
+                continue
+            seen.add((words, label))
+            # Indexed by its first two words: with one typo, one of them is exact
+            for position in (0, 1):
+                self._by_word.setdefault((position, words[position]), []).append((words, label))
+
+    @staticmethod
+    def _typo_of(token: str, word: str) -> bool:
+        if token == word or len(word) < 3 or _edit_distance(token, word, 1) != 1:
+            return False
+        if not is_english_word(token) or token == word.replace("'", ""):  # "cant" for "can't"
+            return True
+        short, long_ = sorted((token, word), key=len)
+        return len(long_) == len(short) + 1 and any(
+            long_[:i] + long_[i + 1:] == short and long_[i] == long_[i - 1] for i in range(1, len(long_))
+        )
+
+    def labels_in(self, text: str) -> Set[str]:
+        tokens = _TOKEN.findall(text)
+        found: Set[str] = set()
+        for start in range(len(tokens)):
+            candidates = self._by_word.get((0, tokens[start]), []) + (
+                self._by_word.get((1, tokens[start + 1]), []) if start + 1 < len(tokens) else []
+            )
+            for words, label in candidates:
+                window = tokens[start:start + len(words)]
+                if len(window) != len(words) or label in found:
+                    continue
+                typos = [(t, w) for t, w in zip(window, words) if t != w]
+                if len(typos) == 1 and self._typo_of(*typos[0]):
+                    found.add(label)
+        return found
+
+
+_FUZZY = FuzzyIndex(*_vocabulary())
+_PHRASE_TYPOS = PhraseTypos(kw for kw in _label_table() if kw[1] in STRICT_LABELS)
+
+
+# ========================
+# MESSAGE SIGNALS
+# ========================
+@dataclass(frozen=True)
+class MessageSignals:
+    crisis: bool
+    risk_level: str
+    comfort: bool
+    distress: bool
+    close: bool
+    emotion: str
+
+
+def _emotion_from_labels(labels: Set[str]) -> str:
+    if "school" in labels and "scold" in labels:
+        return "sad"
+    for emotion in EMOTION_KEYWORDS:
+        if f"emotion:{emotion}" in labels:
+            return emotion
+    return "default"
+
+
+def classify(message: str, fuzzy: bool = FUZZY_MATCHING) -> MessageSignals:
+    """One lowercase + one automaton pass (two if typos were corrected) -> every detector result."""
+    text = message.lower()
+    labels = _AUTOMATON.labels_in(text)
+    if fuzzy:
+        fixed = _FUZZY.corrected(text)
+        if fixed is not None:
+            labels |= _AUTOMATON.labels_in(fixed)
+        if not STRICT_LABELS <= labels:
+            labels |= _PHRASE_TYPOS.labels_in(text)
+    return MessageSignals(
+        crisis="crisis" in labels,
+        risk_level="high" if "high_risk" in labels else "normal",
+        comfort="comfort" in labels,
+        distress="distress" in labels,
+        close="close" in labels,
+        emotion=_emotion_from_labels(labels),
+    )
@@ -0,0 +1,243 @@
+# app/emotion_timeline.py - COLUMNAR EMOTION TIMELINE + ROLLING AGGREGATES
+# A user's emotion history is two parallel arrays, emotion codes and epoch
+# seconds, stored in fixed-size chunks, so an append rewrites one small blob.
+# Per-day and per-week counts, streaks and a last-N window are updated on every
+# append, so trend queries read one row per bucket and never scan the log.
+#
+# Everything here works on a connection inside the caller's transaction;
+# memory_manager owns the shards and exposes the public API.
+import sys
+import time
+from array import array
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+CHUNK_SIZE = 1024       # entries per stored chunk
+RECENT_WINDOW = 50      # codes kept for the last-N distribution
+
+TIMELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emotion_codes (
+    code INTEGER PRIMARY KEY,
+    emotion TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS emotion_columns (
+    user_id TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    codes BLOB NOT NULL,
+    times BLOB NOT NULL,
+    PRIMARY KEY (user_id, chunk)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS emotion_daily (
+    user_id TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    code INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, bucket, code)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS emotion_weekly (
+    user_id TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    code INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, bucket, code)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS emotion_stats (
+    user_id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    last_code INTEGER,
+    run INTEGER NOT NULL,
+    best_code INTEGER,
+    best_run INTEGER NOT NULL,
+    last_day INTEGER,
+    day_streak INTEGER NOT NULL,
+    best_day_streak INTEGER NOT NULL,
+    recent BLOB NOT NULL
+);
+"""
+
+# Per-user tables (emotion_codes is shared by everyone on the shard)
+TIMELINE_TABLES = ("emotion_columns", "emotion_daily", "emotion_weekly", "emotion_stats")
+
+_BUCKET_TABLES = {"day": "emotion_daily", "week": "emotion_weekly"}
+
+
+# ========================
+# ENCODING
+# ========================
+# Arrays are stored little-endian so shard files move between machines
+def _pack(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode: str, blob: Optional[bytes]) -> array:
+    values = array(typecode)
+    values.frombytes(blob or b"")
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _day(ts: float) -> int:
+    return date.fromtimestamp(ts).toordinal()
+
+
+def _week(day: int) -> int:
+    return (day - 1) // 7  # ordinal 1 is a Monday, so weeks start on Monday
+
+
+def _label(bucket: int, unit: str) -> str:
+    return date.fromordinal(bucket if unit == "day" else bucket * 7 + 1).isoformat()
+
+
+def _code(conn, emotion: str) -> int:
+    conn.execute("INSERT OR IGNORE INTO emotion_codes (emotion) VALUES (?)", (emotion,))
+    return conn.execute("SELECT code FROM emotion_codes WHERE emotion = ?", (emotion,)).fetchone()[0]
+
+
+def _names(conn) -> Dict[int, str]:
+    return dict(conn.execute("SELECT code, emotion FROM emotion_codes"))
+
+
+# ========================
+# WRITE PATH
+# ========================
+def append(conn, user_id: str, emotion: str, ts: float) -> None:
+    """Add one entry and update every aggregate; O(CHUNK_SIZE) at most."""
+    code = _code(conn, emotion)
+    row = conn.execute(
+        "SELECT total, last_code, run, best_code, best_run, last_day, day_streak,"
+        " best_day_streak, recent FROM emotion_stats WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    (total, last_code, run, best_code, best_run,
+     last_day, day_streak, best_day_streak, recent) = row or (0, None, 0, None, 0, None, 0, 0, b"")
+
+    # Columns: only the newest chunk is rewritten
+    chunk = total // CHUNK_SIZE
+    stored = conn.execute(
+        "SELECT codes, times FROM emotion_columns WHERE user_id = ? AND chunk = ?", (user_id, chunk)
+    ).fetchone()
+    codes = _unpack("H", stored[0] if stored else None)
+    times = _unpack("q", stored[1] if stored else None)
+    codes.append(code)
+    times.append(int(ts))
+    conn.execute(
+        "INSERT OR REPLACE INTO emotion_columns (user_id, chunk, codes, times) VALUES (?, ?, ?, ?)",
+        (user_id, chunk, _pack(codes), _pack(times)),
+    )
+
+    # Bucket counts
+    day = _day(ts)
+    for table, bucket in (("emotion_daily", day), ("emotion_weekly", _week(day))):
+        conn.execute(
+            f"INSERT INTO {table} (user_id, bucket, code, count) VALUES (?, ?, ?, 1)"
+            " ON CONFLICT (user_id, bucket, code) DO UPDATE SET count = count + 1",
+            (user_id, bucket, code),
+        )
+
+    # Streaks: same emotion in a row, and days in a row with any entry
+    run = run + 1 if code == last_code else 1
+    if run > best_run:
+        best_code, best_run = code, run
+    if last_day is None or day > last_day + 1:
+        day_streak = 1
+    elif day == last_day + 1:
+        day_streak += 1
+    best_day_streak = max(best_day_streak, day_streak)
+    last_day = day if last_day is None else max(last_day, day)
+
+    window = _unpack("H", recent)
+    window.append(code)
+    conn.execute(
+        "INSERT OR REPLACE INTO emotion_stats (user_id, total, last_code, run, best_code, best_run,"
+        " last_day, day_streak, best_day_streak, recent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, total + 1, code, run, best_code, best_run,
+         last_day, day_streak, best_day_streak, _pack(window[-RECENT_WINDOW:])),
+    )
+
+
+# ========================
+# QUERIES
+# ========================
+def trend(conn, user_id: str, unit: str = "day", periods: int = 14, now: Optional[float] = None) -> Dict:
+    """
+    Counts per emotion for the last `periods` days or weeks, oldest first:
+    {"buckets": [start dates], "series": {emotion: [count per bucket]}}.
+    """
+    end = _day(now if now is not None else time.time())
+    if unit == "week":
+        end = _week(end)
+    start = end - periods + 1
+    names = _names(conn)
+    series: Dict[str, List[int]] = {}
+    for bucket, code, count in conn.execute(
+        f"SELECT bucket, code, count FROM {_BUCKET_TABLES[unit]}"
+        " WHERE user_id = ? AND bucket BETWEEN ? AND ?",
+        (user_id, start, end),
+    ):
+        series.setdefault(names[code], [0] * periods)[bucket - start] = count
+    return {
+        "buckets": [_label(b, unit) for b in range(start, end + 1)],
+        "series": dict(sorted(series.items())),
+    }
+
+
+def summary(conn, user_id: str, now: Optional[float] = None) -> Dict:
+    """Totals, streaks and the share of each emotion among the last RECENT_WINDOW entries."""
+    row = conn.execute(
+        "SELECT total, last_code, run, best_code, best_run, last_day, day_streak,"
+        " best_day_streak, recent FROM emotion_stats WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        return {"total": 0, "streak": None, "best_streak": None, "day_streak": 0,
+                "best_day_streak": 0, "recent": {}}
+    total, last_code, run, best_code, best_run, last_day, day_streak, best_day_streak, recent = row
+    names = _names(conn)
+    window = _unpack("H", recent)
+    counts: Dict[str, int] = {}
+    for code in window:
+        counts[names[code]] = counts.get(names[code], 0) + 1
+    today = _day(now if now is not None else time.time())
+    return {
+        "total": total,
+        "streak": {"emotion": names[last_code], "length": run},
+        "best_streak": {"emotion": names[best_code], "length": best_run},
+        # A day streak is still alive if the last entry was today or yesterday
+        "day_streak": day_streak if last_day >= today - 1 else 0,
+        "best_day_streak": best_day_streak,
+        "recent": {e: round(n / len(window), 3) for e, n in sorted(counts.items(), key=lambda kv: -kv[1])},
+    }
+
+
+def _entries(names: Dict[int, str], codes: array, times: array) -> List[Dict[str, str]]:
+    return [
+        {"emotion": names[c], "time": datetime.fromtimestamp(t).isoformat()}
+        for c, t in zip(codes, times)
+    ]
+
+
+def recent(conn, user_id: str, limit: int) -> List[Dict[str, str]]:
+    """Last `limit` entries as {"emotion", "time"} dicts, oldest first."""
+    names = _names(conn)
+    out: List[Dict[str, str]] = []
+    for codes, times in conn.execute(
+        "SELECT codes, times FROM emotion_columns WHERE user_id = ? ORDER BY chunk DESC", (user_id,)
+    ):
+        out = _entries(names, _unpack("H", codes), _unpack("q", times)) + out
+        if len(out) >= limit:
+            break
+    return out[-limit:] if limit else []
+
+
+def all_entries(conn, user_id: str) -> List[Dict[str, str]]:
+    names = _names(conn)
+    out: List[Dict[str, str]] = []
+    for codes, times in conn.execute(
+        "SELECT codes, times FROM emotion_columns WHERE user_id = ? ORDER BY chunk", (user_id,)
+    ):
+        out += _entries(names, _unpack("H", codes), _unpack("q", times))
+    return out
@@ -0,0 +1,335 @@
+# app/fake_ollama.py - LOCAL OLLAMA STAND-IN FOR LATENCY + FAILURE TESTS
+# Speaks the small part of the Ollama HTTP API that ChatOllama and the health
+# probe use (/api/chat, /api/generate, /api/tags, /api/version), streaming
+# NDJSON like the real server. Speed, errors and parallelism are configurable,
+# and replies are canned inner-voice lines ending in an [EMOTION=...] tag.
+# Like Ollama, each model keeps the last prompt it evaluated and only pays
+# prompt-eval time for the part after the longest shared prefix, and a model
+# idle for longer than the request's keep_alive is unloaded (next call pays load).
+#
+#   python fake_ollama.py --port 11435 --ttft 0.3 --tps 25 --error-rate 0.05
+#   OLLAMA_BASE_URL=http://127.0.0.1:11435 streamlit run main.py
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+from detectors import classify
+from llm_client import duration_seconds
+
+CANNED_REPLIES = {
+    "lonely": "It hurts to feel this alone right now. What happened that made you feel so left out?",
+    "sad": "This is sitting heavy on your heart. What part of it hurts the most?",
+    "anxious": "Your mind is racing with this. What are you most afraid will happen?",
+    "angry": "This really sparked something in you. What felt the most unfair?",
+    "tired": "This is draining you deeply. What is taking the most energy from you?",
+    "happy": "This is bringing you a little light. What part of it means the most to you?",
+    "default": "This is clearly touching you in a real way. What feels most important to share?",
+}
+
+
+@dataclass
+class FakeOllamaConfig:
+    first_token_delay: float = 0.2      # seconds before the first token
+    tokens_per_sec: float = 30.0
+    error_rate: float = 0.0             # share of requests answered with HTTP 500
+    hang_rate: float = 0.0              # share of requests that stall for hang_seconds first
+    hang_seconds: float = 30.0
+    parallel: int = 1                   # like OLLAMA_NUM_PARALLEL; extra requests queue
+    prompt_eval_per_token: float = 0.002  # seconds per prompt word not covered by the cached prefix
+    load_seconds: float = 0.0           # model load time on the first call (or after keep_alive=0)
+    models: List[str] = field(default_factory=lambda: ["llama3:latest"])
+
+
+@dataclass
+class FakeOllamaStats:
+    requests: int = 0
+    errors: int = 0
+    hangs: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    queued: int = 0
+    peak_queued: int = 0
+    prompt_tokens: int = 0              # prompt words sent
+    prompt_evaluated: int = 0           # prompt words actually evaluated (not served from the prefix cache)
+    loads: int = 0                      # cold starts (model load paid)
+    unloads: int = 0                    # idle unloads after keep_alive ran out
+
+
+def _user_text(prompt: str) -> str:
+    """The user's line from the inner-voice prompt (the rest is system text)."""
+    for line in prompt.splitlines():
+        if line.startswith("User says:"):
+            return line[len("User says:"):].strip()
+    return prompt
+
+
+def canned_reply(prompt: str) -> str:
+    emotion = classify(_user_text(prompt)).emotion
+    return f"{CANNED_REPLIES[emotion]}\n\n[EMOTION={emotion}]"
+
+
+def _tokens(text: str) -> List[str]:
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + [words[-1]]
+
+
+def _shared_words(a: str, b: str) -> int:
+    """Whole words at the start of `b` that are byte-identical to `a`."""
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    if i == len(b):
+        return len(b.split())
+    return len(b[:i].split()) - (0 if i == 0 or b[i - 1].isspace() else 1)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllama:
+    def __init__(self, config: Optional[FakeOllamaConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeOllamaConfig()
+        self.stats = FakeOllamaStats()
+        self._slots = threading.Semaphore(self.config.parallel)
+        self._lock = threading.Lock()
+        self._kv: Dict[str, str] = {}   # model -> last evaluated prompt
+        self._unload_at: Dict[str, float] = {}  # model -> when keep_alive runs out
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---- prompt eval ----
+    def _evaluate_prompt(self, model: str, prompt: str, keep_alive) -> Dict[str, int]:
+        """Charge load + prompt-eval time; returns the Ollama timing fields."""
+        cfg = self.config
+        with self._lock:
+            now = time.monotonic()
+            if self._unload_at.get(model, float("inf")) < now:
+                self._kv.pop(model, None)   # idle past its keep_alive
+                del self._unload_at[model]
+                self.stats.unloads += 1
+            cached = self._kv.get(model)
+            total = len(prompt.split())
+            reused = _shared_words(cached, prompt) if cached is not None else 0
+            evaluated = max(1, total - reused)
+            self.stats.prompt_tokens += total
+            self.stats.prompt_evaluated += evaluated
+            keep = duration_seconds(keep_alive) if keep_alive is not None else 300.0  # Ollama's 5m default
+            if keep == 0:
+                self._kv.pop(model, None)   # unloaded right after this call
+                self._unload_at.pop(model, None)
+            else:
+                self._kv[model] = prompt
+                self._unload_at[model] = now + keep if keep > 0 else float("inf")
+            if cached is None:
+                self.stats.loads += 1
+        load = cfg.load_seconds if cached is None else 0.0
+        eval_seconds = evaluated * cfg.prompt_eval_per_token
+        time.sleep(load + eval_seconds)
+        return {
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(eval_seconds * 1e9),
+        }
+
+    # ---- generation ----
+    def _generate(self, prompt: str, options: Dict) -> Iterator[str]:
+        """Yield tokens at the configured pace, honouring num_predict and stop."""
+        cfg = self.config
+        text = canned_reply(prompt)
+        for stop in options.get("stop") or []:
+            if stop and stop in text:
+                text = text[:text.index(stop)]
+        tokens = _tokens(text)
+        limit = options.get("num_predict")
+        if limit and limit > 0:
+            tokens = tokens[:limit]
+        time.sleep(cfg.first_token_delay)
+        for token in tokens:
+            yield token
+            time.sleep(1.0 / cfg.tokens_per_sec)
+
+    def _admit(self) -> Optional[int]:
+        """Queue for a slot; returns an HTTP error status to send instead, if any."""
+        cfg = self.config
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.queued += 1
+            self.stats.peak_queued = max(self.stats.peak_queued, self.stats.queued)
+        self._slots.acquire()
+        with self._lock:
+            self.stats.queued -= 1
+            self.stats.in_flight += 1
+            self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+        roll = random.random()
+        if roll < cfg.error_rate:
+            with self._lock:
+                self.stats.errors += 1
+            return 500
+        if roll < cfg.error_rate + cfg.hang_rate:
+            with self._lock:
+                self.stats.hangs += 1
+            time.sleep(cfg.hang_seconds)
+        return None
+
+    def _release(self) -> None:
+        with self._lock:
+            self.stats.in_flight -= 1
+        self._slots.release()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: Dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, lines: Iterator[Dict]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for line in lines:
+                    data = (json.dumps(line) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    models = [{"name": m, "model": m, "size": 0} for m in fake.config.models]
+                    self._json(200, {"models": models})
+                elif self.path == "/api/version":
+                    self._json(200, {"version": "0.0.0-fake"})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/chat":
+                    messages = body.get("messages") or [{}]
+                    prompt = messages[-1].get("content", "")
+                    self._reply(body, prompt, chat=True)
+                elif self.path == "/api/generate":
+                    self._reply(body, body.get("prompt", ""), chat=False)
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def _reply(self, body: Dict, prompt: str, chat: bool) -> None:
+                status = fake._admit()
+                try:
+                    if status:
+                        self._json(status, {"error": "fake ollama: injected failure"})
+                        return
+                    model = body.get("model", fake.config.models[0])
+                    started = time.perf_counter()
+                    timings = fake._evaluate_prompt(model, prompt, body.get("keep_alive"))
+                    tokens = fake._generate(prompt, body.get("options") or {})
+
+                    def piece(token: str, done: bool) -> Dict:
+                        line = {"model": model, "created_at": _now(), "done": done}
+                        if chat:
+                            line["message"] = {"role": "assistant", "content": token}
+                        else:
+                            line["response"] = token
+                        return line
+
+                    def lines() -> Iterator[Dict]:
+                        count = 0
+                        for token in tokens:
+                            count += 1
+                            yield piece(token, False)
+                        final = piece("", True)
+                        final.update(
+                            done_reason="stop",
+                            total_duration=int((time.perf_counter() - started) * 1e9),
+                            eval_count=count,
+                            **timings,
+                        )
+                        yield final
+
+                    if body.get("stream", True):
+                        self._stream(lines())
+                    else:
+                        parts = list(lines())
+                        final = parts[-1]
+                        text = "".join(
+                            (p["message"]["content"] if chat else p["response"]) for p in parts
+                        )
+                        if chat:
+                            final["message"]["content"] = text
+                        else:
+                            final["response"] = text
+                        self._json(200, final)
+                finally:
+                    fake._release()
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fake Ollama server for local latency tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=0.2, help="first-token delay (s)")
+    parser.add_argument("--tps", type=float, default=30.0, help="tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--prompt-eval", type=float, default=0.002, help="seconds per uncached prompt word")
+    parser.add_argument("--load", type=float, default=0.0, help="model load time (s)")
+    args = parser.parse_args(argv)
+
+    config = FakeOllamaConfig(
+        first_token_delay=args.ttft,
+        tokens_per_sec=args.tps,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        parallel=args.parallel,
+        prompt_eval_per_token=args.prompt_eval,
+        load_seconds=args.load,
+    )
+    server = FakeOllama(config, args.host, args.port).start()
+    print(f"🧪 Fake Ollama listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
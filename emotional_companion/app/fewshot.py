@@ -0,0 +1,93 @@
+# app/fewshot.py - FEW-SHOT EXAMPLES OF THE INNER-VOICE STYLE
+# A small corpus of sample exchanges (data/sample_conversations.json) is loaded
+# once, embedded with the same hashed vectors retrieval uses, and bucketed by
+# phase and emotion. Each turn gets the 1-3 examples closest to the message,
+# from its own phase (same emotion first), within a strict token budget.
+# Showing the tone beats describing it, and the model lands it in fewer words.
+#
+# Pools per (phase, emotion) and the rendered blocks are cached, so a pick is a
+# few sparse dot products; the same pick always renders to the same bytes.
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from retrieval import embed, token_count
+from utils import load_sample_conversations
+
+FEWSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sample_conversations.json")
+FEWSHOT_ENABLED = os.getenv("INNER_VOICE_FEWSHOT", "1") != "0"
+FEWSHOT_MAX = 3                # examples per prompt
+FEWSHOT_TOKEN_BUDGET = 128     # tokens of examples allowed into one prompt
+FEWSHOT_POOL = 8               # candidates per (phase, emotion) compared with the message
+EMOTION_BONUS = 1.0            # same emotion outranks any similarity (cosine <= 1)
+
+FEWSHOT_HEADER = "Examples of the inner-voice tone (match the tone, never copy the words):\n"
+
+
+class FewShotSelector:
+    def __init__(self, examples: List[dict]):
+        self.examples = [
+            e for e in examples if e.get("phase") and e.get("user") and e.get("reply")
+        ]
+        self._texts = [
+            f"User: {e['user']}\nInner voice: {e['reply']} [EMOTION={e.get('emotion', 'default')}]\n"
+            for e in self.examples
+        ]
+        self._costs = [token_count(t) for t in self._texts]
+        self._vectors = [embed(e["user"]) for e in self.examples]
+        self._by_phase: Dict[str, List[int]] = {}
+        self._by_pair: Dict[Tuple[str, str], List[int]] = {}
+        for i, e in enumerate(self.examples):
+            self._by_phase.setdefault(e["phase"], []).append(i)
+            self._by_pair.setdefault((e["phase"], e.get("emotion", "default")), []).append(i)
+        self.pool = lru_cache(maxsize=256)(self._pool)
+        self.render = lru_cache(maxsize=1024)(self._render)
+
+    def _pool(self, phase: str, emotion: str) -> Tuple[Tuple[int, float], ...]:
+        """(example, bonus) candidates: same phase and emotion first, then the rest of the phase."""
+        same = self._by_pair.get((phase, emotion), [])
+        rest = [i for i in self._by_phase.get(phase, []) if i not in same]
+        return tuple([(i, EMOTION_BONUS) for i in same] + [(i, 0.0) for i in rest])[:FEWSHOT_POOL]
+
+    def _similarity(self, query: Dict[int, float], i: int) -> float:
+        vec = self._vectors[i]
+        return sum(w * vec.get(d, 0.0) for d, w in query.items())
+
+    def _render(self, picked: Tuple[int, ...]) -> str:
+        if not picked:
+            return ""
+        return FEWSHOT_HEADER + "\n".join(self._texts[i] for i in picked) + "\n"
+
+    def select(self, phase: str, emotion: str, message: str, budget: int = FEWSHOT_TOKEN_BUDGET) -> str:
+        """Prompt block with the closest examples that fit the budget; "" if none do."""
+        pool = self.pool(phase, emotion or "default")
+        if not pool:
+            return ""
+        query = embed(message)
+        scored = sorted(
+            ((bonus + self._similarity(query, i), i) for i, bonus in pool), reverse=True
+        )
+        picked: List[int] = []
+        used = token_count(FEWSHOT_HEADER)
+        for _, i in scored:
+            if used + self._costs[i] > budget:
+                continue
+            picked.append(i)
+            used += self._costs[i]
+            if len(picked) == FEWSHOT_MAX:
+                break
+        return self.render(tuple(sorted(picked)))
+
+
+_selector: Optional[FewShotSelector] = None
+
+
+def selector() -> FewShotSelector:
+    global _selector
+    if _selector is None:
+        _selector = FewShotSelector(load_sample_conversations(FEWSHOT_FILE) if FEWSHOT_ENABLED else [])
+    return _selector
+
+
+def examples_for(phase: str, emotion: str, message: str) -> str:
+    return selector().select(phase, emotion, message)
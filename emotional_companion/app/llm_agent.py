@@ -1,14 +1,26 @@
 # app/llm_agent.py - OLLAMA + SINGLE-SITUATION INNER VOICE
 # SAFETY + COMFORT + DISTRESS + CLOSING MODE
+import functools
 import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
 from typing import Tuple, Optional
 
-from memory_manager import load_user_profile, update_user_profile, log_emotion
+from memory_manager import load_summaries, update_user_profile, log_emotion, turn
+from retrieval import recall, remember
+from detectors import MessageSignals, classify
+from fewshot import examples_for
 
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
-from langchain_community.chat_models import ChatOllama
+from llm_client import DEFAULT_MODEL, registry as llm_registry
+from cassette import CassetteMiss, cassette
+from response_cache import response_cache
+from metrics import inc, metrics, span
+from scheduler import PRIORITY_CLOSING, PRIORITY_ROUTINE, PRIORITY_URGENT, scheduler
+from summariser import summariser, summary_block
+from warmup import warmup
+from router import router
 
 
 # ========================
@@ -120,115 +132,30 @@ OFFLINE_RESPONSES = {
 
 
 # ========================
-# SIMPLE EMOTION DETECTION
+# KEYWORD DETECTORS
 # ========================
+# Thin wrappers over the single-pass classifier in detectors.py. Callers that
+# need more than one signal should call classify() once and reuse the result.
 def get_emotion_from_message(message: str) -> str:
-    text = message.lower()
-
-    # school / exam related
-    if any(w in text for w in ["exam", "test", "marks", "grades", "failed", "fail", "low mark"]):
-        if any(w in text for w in ["scold", "shout", "yell", "angry", "disappointed"]):
-            return "sad"
-
-    if any(w in text for w in ["lonely", "alone", "left out"]):
-        return "lonely"
-    if any(w in text for w in ["sad", "upset", "down", "bad", "hurt", "heartbroken"]):
-        return "sad"
-    if any(w in text for w in ["anxious", "nervous", "worried", "scared", "panic"]):
-        return "anxious"
-    if any(w in text for w in ["angry", "mad", "frustrated", "irritated", "annoyed"]):
-        return "angry"
-    if any(w in text for w in ["tired", "exhausted", "drained", "burned out", "sleepy"]):
-        return "tired"
-    if any(w in text for w in ["happy", "glad", "excited", "joyful", "grateful", "birthday"]):
-        return "happy"
+    return classify(message).emotion
 
-    return "default"
 
-
-# ========================
-# RISK DETECTOR
-# ========================
 def detect_risk_level(message: str) -> str:
     """Very simple keyword-based risk detector."""
-    text = message.lower()
+    return classify(message).risk_level
 
-    high_risk_keywords = [
-        "blackmail", "blackmailing", "threaten", "threatening",
-        "leak my photo", "leak my photos", "leak my pic", "leak my pics",
-        "nude", "nudes",
-        "kill myself", "want to die", "suicide", "hurt myself",
-        "self harm", "self-harm",
-        "abuse", "abused", "rape", "molest", "stalk", "stalking"
-    ]
 
-    for kw in high_risk_keywords:
-        if kw in text:
-            return "high"
-
-    return "normal"
-
-
-# ========================
-# COMFORT REQUEST DETECTOR
-# ========================
 def detect_comfort_request(message: str) -> bool:
-    text = message.lower()
-    comfort_phrases = [
-        "just comfort me",
-        "comfort me",
-        "i just want comfort",
-        "i just need comfort",
-        "i don't want more questions",
-        "stop asking questions",
-        "i just need support",
-        "i just need someone",
-        "make me feel better",
-        "help me feel better",
-        "i feel hopeless",
-        "i am tired of this",
-        "i am tired of everything",
-        "please encourage me",
-        "just give me some advice",
-    ]
-    return any(p in text for p in comfort_phrases)
+    return classify(message).comfort
 
 
-# ========================
-# DISTRESS DETECTOR
-# ========================
 def detect_distress(message: str) -> bool:
     """Detect heavy academic/family distress to encourage comfort mode."""
-    text = message.lower()
-    distress_words = [
-        "failed", "failing", "fail in all", "all subjects",
-        "parents upset", "parents get upset",
-        "loan", "burden", "burden to them",
-        "disappointed", "disappointing",
-        "stress", "stressed", "overwhelmed",
-        "hopeless", "no hope", "tired of this", "tired of everything",
-        "useless", "waste", "good for nothing",
-    ]
-    return any(p in text for p in distress_words)
+    return classify(message).distress
 
 
-# ========================
-# CLOSE REQUEST DETECTOR
-# ========================
 def detect_close_request(message: str) -> bool:
-    text = message.lower()
-    close_phrases = [
-        "that's enough",
-        "enough questions",
-        "stop asking questions",
-        "i don't want to talk more",
-        "i don't want to talk anymore",
-        "let's end this",
-        "end this",
-        "thank you, that's all",
-        "thank you thats all",
-    ]
-    return any(p in text for p in close_phrases)
+    return classify(message).close
 
 
 # ========================
@@ -266,26 +193,21 @@ def generate_safety_response(user_message: str) -> Tuple[str, str]:
 # ========================
 def get_llm():
     """
-    Returns a ChatOllama instance if Ollama is running,
+    Returns the shared ChatOllama instance while Ollama is healthy,
     otherwise returns None and the app will use offline templates.
     """
-    try:
-        llm = ChatOllama(
-            model="llama3",  # ensure: ollama pull llama3
-            temperature=0.7,
-        )
-        print("✅ Using local Ollama model: llama3")
-        return llm
-    except Exception as e:
-        print(f"⚠️ Ollama not available, using offline mode. Error: {e}")
-        return None
+    return llm_registry.get_llm()
 
 
 # ========================
 # OFFLINE RESPONSE GENERATOR (NORMAL MODE, PHASED)
 # ========================
-def generate_offline_response(user_message: str, turn_count: int) -> Tuple[str, str]:
-    emotion = get_emotion_from_message(user_message)
+def generate_offline_response(
+    user_message: str,
+    turn_count: int,
+    signals: Optional[MessageSignals] = None,
+) -> Tuple[str, str]:
+    emotion = (signals or classify(user_message)).emotion
     r = OFFLINE_RESPONSES[emotion]
 
     short_msg = user_message.strip()
@@ -310,19 +232,9 @@ def generate_offline_response(user_message: str, turn_count: int) -> Tuple[str,
 
 
 # ========================
-# CHAIN BUILDER (LLM PATH)
+# PROMPT LAYOUT (STABLE PREFIX + PER-TURN SUFFIX)
 # ========================
-def _build_chain(llm):
-    prompt = PromptTemplate.from_template(
-        """
-{system}
-
-Current phase: {phase}
-
-User is talking about ONE situation.
-
-User says: {message}
-
+PROMPT_RULES = """
 Answer as the user's inner voice.
 
 Rules reminder:
@@ -340,100 +252,591 @@ After your answer, add this on a new line:
 
 [EMOTION=primary_emotion]
 """
-    )
+
+# Byte-identical on every call, so Ollama evaluates it once per model load
+# and reuses its KV cache; everything that changes per turn comes after it.
+PROMPT_PREFIX = SYSTEM_PROMPT + PROMPT_RULES
+
+PROMPT_TURN = """
+{examples}Current phase: {phase}
+
+User is talking about ONE situation.
+
+About them: {summary}
+
+Things they told you before that may matter here (use only what helps, never invent more):
+{memory}
+
+User says: {message}
+
+Your reply as their inner voice, then the tag:
+"""
+
+
+# ========================
+# GENERATION BUDGET
+# ========================
+# Token caps per phase: ~60 words of reply plus the [EMOTION=...] tag, with a
+# little headroom. LLMCall also drops the stream as soon as the tag is closed;
+# there is no server-side stop sequence, since a "]" stop would also cut the
+# reply at any bracket in the prose (and swallow the one closing the tag).
+GENERATION_BUDGET = {
+    "understanding": 96,    # reflection + one question
+    "opinion": 128,         # summary + reflection + question
+    "closing": 96,          # summary + one closing thought
+}
+
+
+def _phase_kind(phase: str) -> str:
+    """"closing: no more questions..." -> "closing"."""
+    kind = phase.split()[0].rstrip(":")
+    return kind if kind in GENERATION_BUDGET else "opinion"
+
+
+def _tag_complete(raw: str) -> bool:
+    start = raw.find(EMOTION_TAG)
+    return start >= 0 and "]" in raw[start:]
+
+
+# ========================
+# CHAIN BUILDER (LLM PATH)
+# ========================
+def _build_chain(llm, num_predict: Optional[int] = None):
+    # Imported on the first LLM turn rather than at app start
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    llm = llm.bind(num_predict=num_predict or GENERATION_BUDGET["opinion"])
+    prompt = PromptTemplate.from_template(PROMPT_PREFIX + PROMPT_TURN)
     return prompt | llm | StrOutputParser()
 
 
 # ========================
-# MAIN PUBLIC FUNCTION
+# SCHEDULING CLASS
 # ========================
-def analyze_and_respond(
-    user_message: str,
-    user_summary: str = "",
-    turn_count: int = 1,
-) -> Tuple[str, Optional[str]]:
+def _priority(signals: MessageSignals) -> int:
+    """Struggling users first, then people wrapping up, then everything else."""
+    if signals.distress or signals.comfort:
+        return PRIORITY_URGENT
+    if signals.close:
+        return PRIORITY_CLOSING
+    return PRIORITY_ROUTINE
 
-    # 1) Detect risk level first
-    risk_level = detect_risk_level(user_message)
 
-    # 2) If high risk, go straight to safety-mode response
-    if risk_level == "high":
-        raw, emotion = generate_safety_response(user_message)
-        clean_response = raw.split("[EMOTION=")[0].strip()
+def _render_prompt(input_data: dict) -> str:
+    """The exact text the model sees (what cassettes are keyed on)."""
+    return (PROMPT_PREFIX + PROMPT_TURN).format(**input_data)
 
-        # Save to memory
-        update_user_profile(context=f"User: {user_message}")
-        update_user_profile(context=f"InnerCompanion: {clean_response}")
-        if emotion:
-            log_emotion(emotion)
 
-        return clean_response, emotion
+def _route(signals: MessageSignals, phase: str, user_message: str) -> str:
+    """Which local model answers this turn (see router.py)."""
+    kind = _phase_kind(phase)
+    with span("route"):
+        return router.choose(signals, kind, user_message, GENERATION_BUDGET[kind])
 
-    # 3) Normal inner-voice path (non-high-risk)
-    llm = get_llm()
 
-    # Phase selection (understanding / opinion / closing) with comfort + distress overrides
-    comfort_requested = detect_comfort_request(user_message)
-    distress_detected = detect_distress(user_message)
-    close_requested = detect_close_request(user_message)
+def _model_cold(model: str) -> bool:
+    """The model is still loading; this turn answers offline instead of waiting."""
+    if model != warmup.model:
+        warmup.touch()  # only the first model is warmed; this one loads on demand
+        return False
+    ready = warmup.ready()  # also notes the activity and starts warm-up if needed
+    return not cassette.replaying and not ready
+
+
+def _get_chain(phase: str, model: str = DEFAULT_MODEL):
+    """Shared compiled chain for the model and phase budget (recorded or replayed if configured)."""
+    kind = _phase_kind(phase)
+    if cassette.replaying:
+        return cassette.wrap(None, _render_prompt, model, kind)
+    build = functools.partial(_build_chain, num_predict=GENERATION_BUDGET[kind])
+    return cassette.wrap(llm_registry.get_chain(build, model, kind), _render_prompt, model, kind)
+
+
+# ========================
+# MEMORY (ONE COMMIT PER TURN)
+# ========================
+def _remember_turn(
+    user_message: str, clean_response: str, emotion: Optional[str], user_id: str, closing: bool = False
+) -> None:
+    user_line = f"User: {user_message}"
+    reply_line = f"InnerCompanion: {clean_response}"
+    with span("persist"), turn():
+        update_user_profile(context=user_line, user_id=user_id)
+        update_user_profile(context=reply_line, user_id=user_id)
+        if emotion:
+            log_emotion(emotion, user_id=user_id)
+    remember(user_id, user_line, reply_line)
+    summariser.note_turn(user_id, closing)  # older turns get folded into the summary off the hot path
 
-    if close_requested:
-        phase = "closing: no more questions, just a brief summary and one supportive closing thought"
-    elif comfort_requested:
+
+# ========================
+# PHASE + PROMPT INPUT
+# ========================
+def _select_phase(signals: MessageSignals, turn_count: int) -> str:
+    # Phase selection (understanding / opinion / closing) with comfort + distress overrides
+    if signals.close:
+        return "closing: no more questions, just a brief summary and one supportive closing thought"
+    if signals.comfort:
         # User explicitly asked for comfort, not investigation
-        phase = "opinion focusing on gentle comfort and reassurance for the user"
-    else:
-        # If distress has been described AND we are past the very first turns,
-        # prefer comfort/opinion over endless questioning
-        if distress_detected and turn_count >= 3:
-            phase = "opinion focusing on gentle comfort and reassurance for the user"
-        else:
-            if turn_count <= 2:
-                phase = "understanding"
-            else:
-                phase = "opinion focusing on the user's feelings and view, without judging others"
-
-    # History is kept for logging, but not directly injected into the short prompt
-    profile = load_user_profile()
-    recent = profile.get("contexts", [])[-10:]
-    history = "\n".join(recent) if recent else "No prior conversation."
-
-    input_data = {
-        "system": SYSTEM_PROMPT,
+        return "opinion focusing on gentle comfort and reassurance for the user"
+    # If distress has been described AND we are past the very first turns,
+    # prefer comfort/opinion over endless questioning
+    if signals.distress and turn_count >= 3:
+        return "opinion focusing on gentle comfort and reassurance for the user"
+    if turn_count <= 2:
+        return "understanding"
+    return "opinion focusing on the user's feelings and view, without judging others"
+
+
+def _build_input(
+    user_message: str, user_summary: str, phase: str, user_id: str, emotion: str = "default"
+) -> dict:
+    # A few examples of the tone for this phase and emotion
+    with span("fewshot"):
+        examples = examples_for(_phase_kind(phase), emotion, user_message)
+
+    # Only the most relevant earlier turns, within a fixed token budget
+    with span("retrieval"):
+        memory = recall(user_id, user_message)
+        # Fixed-size summaries written by the background summariser
+        summary = " ".join(filter(None, [user_summary, summary_block(load_summaries(user_id))]))
+
+    return {
+        "examples": examples,
         "phase": phase,
         "message": user_message,
-        "summary": user_summary or "No background yet.",
-        "history": history,
+        "summary": summary or "No background yet.",
+        "memory": memory or "Nothing yet.",
     }
 
-    raw = None
 
-    # Try local LLM first
-    if llm:
+def _cache_context(user_summary: str, emotion: str) -> str:
+    """
+    What besides model, phase and message keys a cached reply: the profile
+    line (so one user's name never reaches another) and the detected emotion.
+    Recalled memory and rolling summaries change every turn, so keying on
+    them would leave a user who repeats themselves with no hits at all.
+    """
+    return f"{emotion}\n{user_summary}"
+
+
+def _split_emotion(raw: str) -> Tuple[str, Optional[str]]:
+    """Split model output into (clean reply, emotion from the [EMOTION=...] tag)."""
+    emotion = None
+    if "[EMOTION=" in raw:
+        try:
+            emotion = raw.split("[EMOTION=")[1].split("]")[0].strip()
+        except Exception:
+            pass
+    return raw.split("[EMOTION=")[0].strip(), emotion
+
+
+# ========================
+# LATENCY DEADLINES (LLM VS OFFLINE)
+# ========================
+# A slow but alive Ollama must not hold a turn forever: past the deadline the
+# offline template answers instead. 0 disables a deadline.
+FIRST_TOKEN_DEADLINE = float(os.getenv("INNER_VOICE_FIRST_TOKEN_DEADLINE", "6"))  # seconds
+TURN_DEADLINE = float(os.getenv("INNER_VOICE_TURN_DEADLINE", "20"))              # seconds
+# What happens to a call that misses its deadline: "cache" lets it finish in the
+# background and stores the reply for next time, "cancel" stops it.
+LATE_REPLIES = os.getenv("INNER_VOICE_LATE_REPLIES", "cache")
+
+_DONE = object()
+
+
+class DeadlineMissed(Exception):
+    pass
+
+
+class LLMCall:
+    """
+    chain.stream() on a scheduler worker thread. The turn reads chunks under
+    the deadlines; the worker records breaker success/failure and caches the
+    finished reply, even if the turn has already moved on.
+    """
+
+    def __init__(
+        self,
+        chain,
+        input_data: dict,
+        priority: int = PRIORITY_ROUTINE,
+        user_id: str = "default_user",
+        model: str = DEFAULT_MODEL,
+        cache_context: str = "",
+    ):
+        self.model = model
+        self.cache_context = cache_context
+        self.raw = ""
+        self._chunk_sizes = []
+        self.abandoned = False
+        self._cancelled = False
+        self._running = False
+        self._settled = False  # success or failure reported to the circuit breaker
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._start = time.perf_counter()
+        router.started(model)
+        scheduler.submit(lambda: self._run(chain, input_data), priority, user_id)
+
+    def _run(self, chain, input_data: dict) -> None:
+        try:
+            self._generate(chain, input_data)
+        finally:
+            router.done(self.model)
+            if not self._settled:
+                # Cancelled, timed out before it ran, or a cassette miss: say nothing
+                # about Ollama, but don't leave a half-open breaker waiting on this call
+                llm_registry.release_trial()
+
+    def _generate(self, chain, input_data: dict) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._running = True
+        stream = None
+        started = time.perf_counter()
+        first_at = None
+        try:
+            stream = chain.stream(input_data)
+            for chunk in stream:
+                if self._cancelled:
+                    inc("llm_cancelled")
+                    return
+                if first_at is None:
+                    first_at = time.perf_counter()
+                self.raw += chunk
+                self._chunk_sizes.append(len(chunk))
+                self._queue.put(chunk)
+                if _tag_complete(self.raw):
+                    # The reply is done once its tag is; anything after is thrown away
+                    inc("llm_early_stop")
+                    break
+        except Exception as e:
+            if not isinstance(e, CassetteMiss):  # a missing recording says nothing about Ollama
+                llm_registry.record_failure(e)
+                self._settled = True
+                router.failed(self.model)
+            self._queue.put(e)
+            return
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()  # a cancelled stream drops its HTTP request
+        llm_registry.record_success()
+        self._settled = True
+        if self.model == warmup.model:
+            warmup.mark_used()
+        if first_at is not None:
+            ttft_ms = (first_at - started) * 1000
+            router.observe(self.model, ttft_ms, len(self._chunk_sizes), time.perf_counter() - first_at)
+        self._count_tokens()
+        response_cache.put(
+            self.model, input_data["phase"], input_data["message"], self.raw, self.cache_context
+        )
+        if self.abandoned:
+            inc("llm_late_reply")
+        self._queue.put(_DONE)
+
+    def _count_tokens(self) -> None:
+        """Streamed chunks ~ tokens: all generated vs those before the tag (what the user sees)."""
+        tag_at = self.raw.find(EMOTION_TAG)
+        kept, offset = 0, 0
+        for size in self._chunk_sizes:
+            if 0 <= tag_at < offset + size:
+                break
+            offset += size
+            kept += 1
+        inc("llm_tokens_generated", len(self._chunk_sizes))
+        inc("llm_tokens_kept", kept)
+        if tag_at < 0:
+            inc("llm_missing_tag")  # ran into the token cap (or ignored the format)
+
+    def _timeout(self, first: bool) -> Optional[float]:
+        limits = [TURN_DEADLINE] + ([FIRST_TOKEN_DEADLINE] if first else [])
+        limits = [limit for limit in limits if limit > 0]
+        if not limits:
+            return None
+        return max(0.0, self._start + min(limits) - time.perf_counter())
+
+    def chunks(self):
+        """Raw chunks as they arrive; raises DeadlineMissed or the LLM's error."""
+        first = True
+        while True:
+            try:
+                item = self._queue.get(timeout=self._timeout(first))
+            except queue.Empty:
+                self._abandon()
+                raise DeadlineMissed("first token" if first else "full reply")
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            first = False
+            yield item
+
+    def _abandon(self) -> None:
+        inc("llm_deadline_missed")
+        with self._lock:
+            self.abandoned = True
+            # A call still waiting for a worker is never worth starting
+            if LATE_REPLIES == "cancel" or not self._running:
+                self._cancelled = True
+
+
+# ========================
+# MAIN PUBLIC FUNCTION
+# ========================
+@dataclass
+class TurnResult:
+    response: str
+    emotion: Optional[str]
+    # "safety", "cache", "llm", "llm_truncated" (cut off by the token cap or the deadline),
+    # "offline", "deadline" (offline because the LLM was too slow) or "cold" (offline
+    # while the model loads)
+    path: str
+
+
+def run_turn(
+    user_message: str,
+    user_summary: str = "",
+    turn_count: int = 1,
+    signals: Optional[MessageSignals] = None,
+    user_id: str = "default_user",
+) -> TurnResult:
+    """analyze_and_respond, plus which path produced the reply."""
+
+    with span("agent_turn"):
+        result = _run_turn(user_message, user_summary, turn_count, signals, user_id)
+    inc(f"path_{result.path}")
+    return result
+
+
+def _run_turn(
+    user_message: str,
+    user_summary: str,
+    turn_count: int,
+    signals: Optional[MessageSignals],
+    user_id: str,
+) -> TurnResult:
+    # 1) One classifier pass gives risk, comfort, distress, close and emotion
+    if signals is None:
+        with span("detectors"):
+            signals = classify(user_message)
+
+    # 2) If high risk, go straight to safety-mode response
+    if signals.risk_level == "high":
+        raw, emotion = generate_safety_response(user_message)
+        clean_response = raw.split("[EMOTION=")[0].strip()
+
+        _remember_turn(user_message, clean_response, emotion, user_id, signals.close)
+        return TurnResult(clean_response, emotion, "safety")
+
+    # 3) Normal inner-voice path (non-high-risk)
+    phase = _select_phase(signals, turn_count)
+    model = _route(signals, phase, user_message)
+    cache_context = _cache_context(user_summary, signals.emotion)
+
+    # Cached reply for the same (model, phase, message) skips the prompt and Ollama entirely
+    with span("cache_lookup"):
+        raw = response_cache.get(model, phase, user_message, cache_context)
+    path = "cache"
+
+    # Otherwise try local LLM (skipped while the circuit breaker is open or the model is cold)
+    with span("chain_lookup"):
+        cold = raw is None and _model_cold(model)
+        chain = _get_chain(phase, model) if raw is None and not cold else None
+    missed = False
+    if chain:
+        path = "llm"
+        input_data = _build_input(user_message, user_summary, phase, user_id, signals.emotion)
         try:
-            chain = _build_chain(llm)
-            raw = chain.invoke(input_data)
+            with span("llm_call"):
+                raw = "".join(
+                    LLMCall(chain, input_data, _priority(signals), user_id, model, cache_context).chunks()
+                )
+        except DeadlineMissed as e:
+            missed = True
+            print(f"⏱️ Local LLM missed its {e} deadline, answering offline")
         except Exception as e:
+            inc("llm_fallback")
             print(f"⚠️ Local LLM error, falling back offline: {e}")
 
-    # Offline fallback if LLM not available or failed
+    # Offline fallback if LLM not available, failed or too slow
     if not raw:
-        raw, emotion = generate_offline_response(user_message, turn_count)
+        path = "deadline" if missed else ("cold" if cold else "offline")
+        with span("offline_response"):
+            raw, emotion = generate_offline_response(user_message, turn_count, signals)
+        clean_response = raw.split("[EMOTION=")[0].strip()
     else:
-        # Extract emotion tag from LLM output
-        emotion = None
-        if "[EMOTION=" in raw:
-            try:
-                emotion = raw.split("[EMOTION=")[1].split("]")[0].strip()
-            except Exception:
-                pass
+        clean_response, emotion = _split_emotion(raw)
+        if emotion is None and path == "llm":
+            path = "llm_truncated"  # the token cap hit before the tag
+        emotion = emotion or signals.emotion
 
-    clean_response = raw.split("[EMOTION=")[0].strip()
+    _remember_turn(user_message, clean_response, emotion, user_id, signals.close)
+    return TurnResult(clean_response, emotion, path)
 
-    # Save to memory
-    update_user_profile(context=f"User: {user_message}")
-    update_user_profile(context=f"InnerCompanion: {clean_response}")
-    if emotion:
-        log_emotion(emotion)
 
-    return clean_response, emotion
+def analyze_and_respond(
+    user_message: str,
+    user_summary: str = "",
+    turn_count: int = 1,
+    signals: Optional[MessageSignals] = None,
+    user_id: str = "default_user",
+) -> Tuple[str, Optional[str]]:
+    result = run_turn(user_message, user_summary, turn_count, signals, user_id)
+    return result.response, result.emotion
+
+
+# ========================
+# STREAMING VARIANT
+# ========================
+EMOTION_TAG = "[EMOTION="
+
+
+class EmotionTagFilter:
+    """
+    Incremental parser for streamed output. feed() returns only text that can
+    safely be shown: once "[EMOTION=" starts, the rest is held back, and a
+    trailing partial "[EMO..." is kept until the next chunk decides it.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self._shown = 0
+        self._tag_at = -1
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self._tag_at < 0:
+            self._tag_at = self.raw.find(EMOTION_TAG, self._shown)
+        if self._tag_at >= 0:
+            safe = self._tag_at
+        else:
+            safe = len(self.raw)
+            for k in range(min(len(EMOTION_TAG) - 1, len(self.raw)), 0, -1):
+                if EMOTION_TAG.startswith(self.raw[-k:]):
+                    safe -= k
+                    break
+        out = self.raw[self._shown:safe]
+        self._shown = max(self._shown, safe)
+        return out
+
+    def finish(self) -> Tuple[str, Optional[str]]:
+        return _split_emotion(self.raw)
+
+
+class ResponseStream:
+    """
+    Iterable of visible reply chunks. When iteration ends the turn has been
+    saved, and `.response` / `.emotion` / `.path` hold the final values.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.response = ""
+        self.emotion: Optional[str] = None
+        self.path = ""
+
+    def __iter__(self):
+        result = yield from self._chunks
+        self.response, self.emotion, self.path = result.response, result.emotion, result.path
+
+
+def _stream_llm(
+    chain,
+    input_data: dict,
+    user_message: str,
+    turn_count: int,
+    signals: MessageSignals,
+    user_id: str,
+    model: str = DEFAULT_MODEL,
+    cache_context: str = "",
+):
+    tag_filter = EmotionTagFilter()
+    shown = ""
+    missed = False
+    start = time.perf_counter()
+    try:
+        for chunk in LLMCall(chain, input_data, _priority(signals), user_id, model, cache_context).chunks():
+            visible = tag_filter.feed(chunk)
+            if visible:
+                if not shown:
+                    metrics.observe("llm_first_token", (time.perf_counter() - start) * 1000)
+                shown += visible
+                yield visible
+        metrics.observe("llm_call", (time.perf_counter() - start) * 1000)
+    except DeadlineMissed as e:
+        missed = True
+        print(f"⏱️ Local LLM missed its {e} deadline")
+    except Exception as e:
+        inc("llm_fallback")
+        print(f"⚠️ Local LLM error, falling back offline: {e}")
+
+    clean_response, emotion = tag_filter.finish()
+    if not shown.strip():
+        # Nothing reached the user yet: answer from the offline templates instead
+        raw, emotion = generate_offline_response(user_message, turn_count, signals)
+        clean_response = raw.split("[EMOTION=")[0].strip()
+        yield clean_response
+        return TurnResult(clean_response, emotion, "deadline" if missed else "offline")
+    path = "llm"
+    if missed:
+        # Cut off mid-reply: keep what the user already saw
+        inc("llm_truncated")
+        clean_response = shown.strip()
+        path = "llm_truncated"
+    elif emotion is None:
+        path = "llm_truncated"  # the token cap hit before the tag
+    return TurnResult(clean_response, emotion or signals.emotion, path)
+
+
+def _stream_turn(
+    user_message: str, user_summary: str, turn_count: int, signals: MessageSignals, user_id: str
+):
+    if signals.risk_level == "high":
+        raw, emotion = generate_safety_response(user_message)
+        clean_response = raw.split("[EMOTION=")[0].strip()
+        yield clean_response
+        result = TurnResult(clean_response, emotion, "safety")
+    else:
+        phase = _select_phase(signals, turn_count)
+        model = _route(signals, phase, user_message)
+        cache_context = _cache_context(user_summary, signals.emotion)
+        with span("cache_lookup"):
+            cached = response_cache.get(model, phase, user_message, cache_context)
+        cold = cached is None and _model_cold(model)
+        chain = _get_chain(phase, model) if cached is None and not cold else None
+        if cached is not None:
+            clean_response, emotion = _split_emotion(cached)
+            yield clean_response
+            result = TurnResult(clean_response, emotion or signals.emotion, "cache")
+        elif chain:
+            input_data = _build_input(user_message, user_summary, phase, user_id, signals.emotion)
+            result = yield from _stream_llm(
+                chain, input_data, user_message, turn_count, signals, user_id, model, cache_context
+            )
+        else:
+            raw, emotion = generate_offline_response(user_message, turn_count, signals)
+            clean_response = raw.split("[EMOTION=")[0].strip()
+            yield clean_response
+            result = TurnResult(clean_response, emotion, "cold" if cold else "offline")
+
+    _remember_turn(user_message, result.response, result.emotion, user_id, signals.close)
+    inc(f"path_{result.path}")
+    return result
+
+
+def stream_analyze_and_respond(
+    user_message: str,
+    user_summary: str = "",
+    turn_count: int = 1,
+    signals: Optional[MessageSignals] = None,
+    user_id: str = "default_user",
+) -> ResponseStream:
+    """Same turn logic as analyze_and_respond, but yields reply text as it is generated."""
+    if signals is None:
+        signals = classify(user_message)
+    return ResponseStream(_stream_turn(user_message, user_summary, turn_count, signals, user_id))
@@ -0,0 +1,309 @@
+# app/llm_client.py - PROCESS-WIDE OLLAMA CLIENT + HEALTH PROBE + CIRCUIT BREAKER
+# One ChatOllama instance and one compiled chain per model for the whole
+# process. A background thread pings Ollama cheaply, and a circuit breaker
+# sends turns straight to the offline templates while the model is down.
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Optional, Tuple
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+DEFAULT_MODEL = os.getenv("INNER_VOICE_MODEL", "llama3")
+# Models turns may be routed to, largest first (see router.py); the first one is kept warm
+MODELS = [m.strip() for m in os.getenv("INNER_VOICE_MODELS", DEFAULT_MODEL).split(",") if m.strip()] or [DEFAULT_MODEL]
+# How long Ollama keeps the model (and its cached prompt prefix) loaded after a call
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d*)?|\.\d+)(ns|us|µs|ms|s|m|h)")
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def duration_seconds(value: Any) -> float:
+    """
+    Ollama keep_alive in seconds: a number of seconds (300, "300") or a Go
+    duration ("30m", "1h30m", "1.5h", "-1m"). 0 unloads right after each
+    call; a negative value keeps the model loaded forever.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    sign, body = (-1.0, text[1:]) if text[:1] == "-" else (1.0, text.lstrip("+"))
+    parts = _DURATION_PART.findall(body)
+    if not body or "".join(n + u for n, u in parts) != body:
+        raise ValueError(f"invalid keep_alive duration: {value!r}")
+    return sign * sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+
+
+PROBE_INTERVAL = float(os.getenv("INNER_VOICE_PROBE_INTERVAL", "15"))  # seconds between health pings
+PROBE_TIMEOUT = 1.0
+FAILURE_THRESHOLD = 2       # consecutive failures before the circuit opens
+OPEN_COOLDOWN = 30.0        # seconds before an open circuit lets one trial call through
+
+
+# ========================
+# CIRCUIT BREAKER
+# ========================
+class CircuitBreaker:
+    """
+    closed    -> calls go to the model
+    open      -> calls skip the model until the cooldown passes or a probe succeeds
+    half_open -> one trial call; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, cooldown: float = OPEN_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_recovery_at: Optional[float] = None
+        self.last_error = ""
+        self.open_count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                return True
+            return False  # open, or half_open with its trial call in flight
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                self.last_recovery_at = time.time()
+                print("✅ Ollama recovered, closing circuit")
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def release_trial(self) -> None:
+        """An allowed call ended without an outcome (cancelled, timed out, never ran)."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"  # cooldown already over: the next call is the new trial
+
+    def record_failure(self, error: Any) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_failure_at = time.time()
+            self.last_error = str(error)
+            if self.state == "half_open" or (
+                self.state == "closed" and self.consecutive_failures >= self.failure_threshold
+            ):
+                self.state = "open"
+                self.opened_at = self.last_failure_at
+                self.open_count += 1
+                print(f"⚠️ Ollama unhealthy, opening circuit: {error}")
+
+    def trip(self, error: Any) -> None:
+        """Open immediately (e.g. the health probe saw the server go away)."""
+        with self._lock:
+            self.last_failure_at = time.time()
+            self.last_error = str(error)
+            if self.state != "open":
+                self.state = "open"
+                self.opened_at = self.last_failure_at
+                self.open_count += 1
+                print(f"⚠️ Ollama unhealthy, opening circuit: {error}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "open_count": self.open_count,
+                "last_failure_at": self.last_failure_at,
+                "last_recovery_at": self.last_recovery_at,
+                "last_error": self.last_error,
+            }
+
+
+# ========================
+# CLIENT + CHAIN REGISTRY
+# ========================
+class LLMRegistry:
+    def __init__(self, base_url: str = OLLAMA_BASE_URL):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+        self._chains: Dict[Tuple[str, str], Any] = {}
+        self._probe_thread: Optional[threading.Thread] = None
+        self.last_probe_error = ""
+        self._forced_chain = None
+        self._offline_only = False
+
+    # ---- clients ----
+    def _create_client(self, model: str):
+        from langchain_community.chat_models import ChatOllama
+
+        return ChatOllama(
+            model=model,  # ensure: ollama pull llama3
+            base_url=self.base_url,
+            temperature=0.7,
+            keep_alive=KEEP_ALIVE,
+        )
+
+    def get_llm(self, model: str = DEFAULT_MODEL):
+        """Cached client, or None while the circuit is open."""
+        self.start_probe()
+        if not self.breaker.allow():
+            return None
+        with self._lock:
+            llm = self._clients.get(model)
+            if llm is None:
+                try:
+                    llm = self._create_client(model)
+                except Exception as e:
+                    print(f"⚠️ Ollama not available, using offline mode. Error: {e}")
+                    self.breaker.record_failure(e)
+                    return None
+                self._clients[model] = llm
+                print(f"✅ Using local Ollama model: {model}")
+            return llm
+
+    def configure(self, base_url: str) -> None:
+        """Point at another Ollama (e.g. fake_ollama.py); drops cached clients."""
+        with self._lock:
+            self.base_url = base_url.rstrip("/")
+            self._clients.clear()
+            self._chains.clear()
+
+    def use_backend(self, chain: Any = None, offline: bool = False) -> None:
+        """
+        Benchmarks and tools: serve every turn from `chain` (anything with
+        invoke/stream), or force the offline templates. No arguments restores Ollama.
+        """
+        self._forced_chain = chain
+        self._offline_only = offline
+
+    @property
+    def serves_ollama(self) -> bool:
+        """Turns go to a real Ollama (not a benchmark stand-in or forced offline)."""
+        return self._forced_chain is None and not self._offline_only
+
+    def get_chain(
+        self,
+        build: Callable[[Any], Any],
+        model: str = DEFAULT_MODEL,
+        variant: str = "",
+        allow_forced: bool = True,
+    ):
+        """
+        Compiled prompt | llm | parser pipeline, built once per (model, variant).
+        allow_forced=False: only a real model will do (no benchmark stand-in).
+        """
+        if self._offline_only:
+            return None
+        if self._forced_chain is not None:
+            if not allow_forced:
+                return None
+            return self._forced_chain if self.breaker.allow() else None
+        llm = self.get_llm(model)
+        if llm is None:
+            return None
+        with self._lock:
+            chain = self._chains.get((model, variant))
+            if chain is None:
+                chain = build(llm)
+                self._chains[(model, variant)] = chain
+            return chain
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+
+    def record_failure(self, error: Any) -> None:
+        self.breaker.record_failure(error)
+
+    def release_trial(self) -> None:
+        self.breaker.release_trial()
+
+    # ---- one-token calls: prompt-eval measurement + warm-up ----
+    def measure_prompt_eval(
+        self, prompt: str, model: str = DEFAULT_MODEL, timeout: float = 120.0
+    ) -> Dict[str, float]:
+        """
+        One-token /api/generate call; returns how many prompt tokens Ollama had
+        to evaluate (the rest came from its cached prefix) and how long it took.
+        """
+        return self._one_token("/api/generate", {"prompt": prompt}, model, timeout)
+
+    def prime(self, prompt: str, model: str = DEFAULT_MODEL, timeout: float = 300.0) -> Dict[str, float]:
+        """
+        Load the model (if Ollama unloaded it) and evaluate `prompt` into its
+        prefix cache the way turns send it, as a chat user message; this also
+        restarts Ollama's keep-alive timer. Same timings as measure_prompt_eval.
+        """
+        messages = [{"role": "user", "content": prompt}]
+        return self._one_token("/api/chat", {"messages": messages}, model, timeout)
+
+    def _one_token(self, path: str, fields: Dict[str, Any], model: str, timeout: float) -> Dict[str, float]:
+        body = json.dumps({
+            "model": model,
+            **fields,
+            "stream": False,
+            "keep_alive": KEEP_ALIVE,
+            "options": {"num_predict": 1, "temperature": 0.7},
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.base_url}{path}", data=body, headers={"Content-Type": "application/json"}
+        )
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            info = json.loads(resp.read() or b"{}")
+        return {
+            "prompt_eval_count": info.get("prompt_eval_count", 0),
+            "prompt_eval_ms": info.get("prompt_eval_duration", 0) / 1e6,
+            "load_ms": info.get("load_duration", 0) / 1e6,
+            "wall_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    # ---- health ----
+    def probe(self) -> bool:
+        """Cheap liveness check: list local models (no generation)."""
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/api/tags", timeout=PROBE_TIMEOUT) as resp:
+                json.loads(resp.read() or b"{}")
+            return True
+        except Exception as e:
+            self.last_probe_error = str(e)
+            return False
+
+    def _probe_loop(self) -> None:
+        while True:
+            healthy = self.probe()
+            state = self.breaker.state
+            if healthy and state != "closed":
+                self.breaker.record_success()
+            elif not healthy and state == "closed":
+                # A failed ping is enough to stop sending turns into a dead server
+                self.breaker.trip(f"health probe failed: {self.last_probe_error}")
+            time.sleep(PROBE_INTERVAL)
+
+    def start_probe(self) -> None:
+        if self._probe_thread is not None or PROBE_INTERVAL <= 0:
+            return
+        with self._lock:
+            if self._probe_thread is None:
+                self._probe_thread = threading.Thread(
+                    target=self._probe_loop, name="ollama-health", daemon=True
+                )
+                self._probe_thread.start()
+
+    def status(self) -> Dict[str, Any]:
+        info = self.breaker.snapshot()
+        info["models"] = sorted(self._clients)
+        return info
+
+
+registry = LLMRegistry()
@@ -0,0 +1,148 @@
+# app/loadgen.py - CONCURRENT LOAD GENERATOR FOR THE REAL LLM PATH
+# Drives many simulated chat sessions through run_turn (or the streaming
+# variant) against an Ollama endpoint, by default an in-process fake_ollama
+# server with controlled speed and failures. Sessions arrive open-loop at a
+# fixed rate, so queueing, fallback and circuit-breaker behaviour show up
+# the way they would with real users.
+#
+#   python loadgen.py --sessions 50 --rate 5 --parallel 2 --ttft 0.3 --tps 25
+#   python loadgen.py --error-rate 0.3 --stream
+#   python loadgen.py --base-url http://localhost:11434 --sessions 5   # real Ollama
+import argparse
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import benchmark
+from detectors import classify
+from fake_ollama import FakeOllama, FakeOllamaConfig
+from llm_agent import run_turn, stream_analyze_and_respond
+from llm_client import registry
+from safety import safety_response
+
+
+def run_session(conversation: dict, user_id: str, think: float, stream: bool) -> List[Tuple[str, float, float]]:
+    """Returns (path, turn latency, time to first visible text) per turn."""
+    samples = []
+    for turn_count, message in enumerate(conversation["turns"], start=1):
+        start = time.perf_counter()
+        first = None
+        signals = classify(message)
+        if signals.crisis:
+            safety_response()
+            path = "safety"
+        elif stream:
+            reply = stream_analyze_and_respond(message, "First-time user.", turn_count, signals, user_id)
+            for _ in reply:
+                if first is None:
+                    first = time.perf_counter() - start
+            path = reply.path
+        else:
+            path = run_turn(message, "First-time user.", turn_count, signals, user_id).path
+        latency = time.perf_counter() - start
+        samples.append((path, latency, first if first is not None else latency))
+        time.sleep(think)
+    return samples
+
+
+class BreakerWatch:
+    """Samples the circuit breaker state to record open/close transitions."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.transitions: List[Tuple[float, str]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        last = None
+        while not self._stop.is_set():
+            state = registry.breaker.state
+            if state != last:
+                self.transitions.append((round(time.perf_counter() - started, 3), state))
+                last = state
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, dict]:
+    parser = argparse.ArgumentParser(description="Concurrent sessions against a (fake) Ollama.")
+    parser.add_argument("--base-url", help="existing Ollama; default starts a fake server")
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=5.0, help="new sessions per second")
+    parser.add_argument("--think", type=float, default=0.0, help="pause between a session's turns (s)")
+    parser.add_argument("--max-concurrency", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="use stream_analyze_and_respond")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--memory-dir", default=None)
+    # fake server knobs
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tps", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--parallel", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = FakeOllama(FakeOllamaConfig(
+            first_token_delay=args.ttft,
+            tokens_per_sec=args.tps,
+            error_rate=args.error_rate,
+            hang_rate=args.hang_rate,
+            hang_seconds=args.hang_seconds,
+            parallel=args.parallel,
+        )).start()
+        base_url = server.base_url
+
+    benchmark.setup_backend("ollama", args.memory_dir or tempfile.mkdtemp(prefix="inner_voice_load_"),
+                            cache=not args.no_cache, base_url=base_url)
+    conversations = benchmark.synthetic_conversations(args.sessions, args.seed)
+
+    futures = []
+    start = time.perf_counter()
+    with BreakerWatch() as watch, ThreadPoolExecutor(args.max_concurrency) as pool:
+        for n, conversation in enumerate(conversations):
+            # Open-loop arrivals: session n starts at n / rate regardless of backlog
+            delay = start + n / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(run_session, conversation, f"load-{n}", args.think, args.stream))
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+
+    samples = [s for session in results for s in session]
+    report = benchmark.summarise([(path, lat) for path, lat, _ in samples], wall)
+    first = [ttft for path, _, ttft in samples if path in ("llm", "llm_truncated")]
+    report["llm_first_text"] = {
+        "turns": len(first),
+        "p50_ms": round(benchmark.percentile(first, 50) * 1000, 3),
+        "p95_ms": round(benchmark.percentile(first, 95) * 1000, 3),
+        "p99_ms": round(benchmark.percentile(first, 99) * 1000, 3),
+        "max_ms": round(max(first) * 1000, 3) if first else 0.0,
+    }
+    benchmark.print_report(report)
+
+    print(f"circuit: {registry.status()['open_count']} opens, transitions {watch.transitions}")
+    if server:
+        print(f"fake ollama: {vars(server.stats)}")
+        server.stop()
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 # app/main.py
+import time
+import uuid
+
 import streamlit as st
 from dotenv import load_dotenv
 
-# Local imports
-from llm_agent import analyze_and_respond
-from safety import detect_crisis, safety_response
-from memory_manager import load_user_profile, update_user_profile, log_emotion
-
+# Before the local imports: they read OLLAMA_BASE_URL & co. at import time
 load_dotenv()
 
+# Local imports (langchain is only imported on the first LLM turn)
+from llm_agent import stream_analyze_and_respond
+from safety import safety_response
+from memory_manager import (
+    CHAT_PAGE, append_chat, chat_length, emotion_summary, emotion_trend, latest_session, load_chat,
+    load_user_profile, profile_version, update_user_profile
+)
+from metrics import inc, metrics, span
+
 st.set_page_config(page_title="InnerCompanion", page_icon="🤍", layout="centered")
 
 st.title("🤍 InnerCompanion")
@@ -20,6 +28,89 @@ st.markdown(
     """
 )
 
+# -----------------------------------------
+# Process-wide resources — built once, reused by every rerun and session
+# -----------------------------------------
+@st.cache_resource
+def _classifier():
+    from detectors import classify
+
+    return classify
+
+
+@st.cache_resource
+def _llm_registry():
+    from llm_client import registry
+
+    from warmup import warmup
+
+    registry.start_probe()
+    warmup.start()  # load the model now, not on the first message
+    return registry
+
+
+# Derived from the stored profile; recomputed only after the user's shard changes
+@st.cache_data(max_entries=256, show_spinner=False)
+def _user_summary(user_id, version):
+    profile = load_user_profile(user_id)
+    summary = ""
+    if profile.get("name"):
+        summary += f"Name: {profile['name']}. "
+    if profile.get("age"):
+        summary += f"Age: {profile['age']}. "
+    if profile.get("context"):
+        summary += f"Background: {profile['context']}."
+    return summary
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _mood(user_id, unit, version):
+    trend = emotion_trend(user_id, unit=unit, periods=14 if unit == "day" else 12)
+    return trend, emotion_summary(user_id)
+
+
+# -----------------------------------------
+# Session user — ?user=<id> in the URL gives each person their own space
+# -----------------------------------------
+def _query_param(key):
+    query = getattr(st, "query_params", None)  # Streamlit >= 1.30
+    if query is not None:
+        return query.get(key)
+    return st.experimental_get_query_params().get(key, [None])[0]
+
+
+def _set_query_param(key, value):
+    query = getattr(st, "query_params", None)
+    if query is not None:
+        query[key] = value
+    else:
+        params = st.experimental_get_query_params()
+        params[key] = value
+        st.experimental_set_query_params(**params)
+
+
+if "user_id" not in st.session_state:
+    st.session_state.user_id = _query_param("user") or "default_user"
+user_id = st.session_state.user_id
+
+
+# -----------------------------------------
+# Chat session — ?session=<id> survives reloads; without it, resume the latest
+# -----------------------------------------
+def _open_session(session_id):
+    """Load only the newest page of the log; older pages come on request."""
+    st.session_state.session_id = session_id
+    st.session_state.conversation = load_chat(session_id, user_id)
+    st.session_state.shown = max(CHAT_PAGE, len(st.session_state.conversation))
+    st.session_state.turn_count = chat_length(session_id, user_id) // 2
+    _set_query_param("session", session_id)
+
+
+if "session_id" not in st.session_state:
+    _open_session(_query_param("session") or latest_session(user_id) or uuid.uuid4().hex[:12])
+classify = _classifier()
+llm_registry = _llm_registry()
+
 # -----------------------------------------
 # Sidebar — Persistent Profile
 # -----------------------------------------
@@ -35,24 +126,58 @@ with st.sidebar:
     )
     
     if st.button("💾 Save gently", use_container_width=True):
-        update_user_profile(name=name or None, age=age or None, context=context or None)
+        update_user_profile(
+            name=name or None, age=age or None, context=context or None, user_id=user_id
+        )
         st.success("Saved with care 🤍")
 
-# Build user summary
-user_profile = load_user_profile()
-user_summary = ""
-if user_profile.get("name"):
-    user_summary += f"Name: {user_profile['name']}. "
-if user_profile.get("age"):
-    user_summary += f"Age: {user_profile['age']}. "
-if user_profile.get("context"):
-    user_summary += f"Background: {user_profile['context']}."
-
-# Initialize conversation & turn count
-if "conversation" not in st.session_state:
-    st.session_state.conversation = []
-if "turn_count" not in st.session_state:
-    st.session_state.turn_count = 0
+    # Mood over time — precomputed buckets, so this stays instant with years of logs
+    with st.expander("📈 Mood over time"):
+        unit = st.radio("Group by", ["day", "week"], horizontal=True, label_visibility="collapsed")
+        trend, mood = _mood(user_id, unit, profile_version(user_id))
+        if trend["series"]:
+            import pandas as pd
+
+            st.bar_chart(pd.DataFrame(trend["series"], index=trend["buckets"]))
+            st.caption(
+                f"{mood['day_streak']} day(s) in a row · mostly "
+                f"{', '.join(list(mood['recent'])[:2])} lately"
+            )
+        else:
+            st.caption("Your moods will show up here as we talk.")
+
+    if st.button("🌱 New conversation", use_container_width=True):
+        _open_session(uuid.uuid4().hex[:12])
+
+    # Opt-in diagnostics: per-stage timings, counters, model health
+    with st.expander("🔧 Diagnostics"):
+        metrics.enabled = st.checkbox("Collect timings", value=metrics.enabled)
+        if metrics.enabled:
+            from response_cache import response_cache
+            from scheduler import scheduler
+            from summariser import summariser
+            from router import router
+            from warmup import warmup
+
+            snap = metrics.snapshot()
+            if snap["stages"]:
+                st.caption("Stage timings (ms)")
+                st.table(snap["stages"])
+            st.caption("Counters")
+            st.json(snap["counters"])
+            st.caption("Model + cache")
+            st.json({
+                "ollama": llm_registry.status(),
+                "scheduler": scheduler.stats(),
+                "response_cache": response_cache.stats(),
+                "summaries": summariser.stats(),
+                "warmup": warmup.stats(),
+                "routing": router.stats(),
+            })
+
+# Build user summary (cached until the profile changes)
+with span("load_profile"):
+    user_summary = _user_summary(user_id, profile_version(user_id))
 
 # -----------------------------------------
 # Chat Interface
@@ -75,24 +200,44 @@ with col1:
 if send and user_input.strip():
     st.session_state.turn_count += 1
     message = user_input.strip()
+    turn_started = time.perf_counter()
+
+    # One classifier pass; the same signals are reused by the agent
+    with span("detectors"):
+        signals = classify(message)
 
     # Safety first
-    if detect_crisis(message):
+    if signals.crisis:
+        inc("safety_crisis")
         response = safety_response()
         emotion = "crisis"
     else:
-        response, emotion = analyze_and_respond(
+        # Stream the reply into a placeholder so the first words show up right away
+        st.markdown(f"**You:** {message}")
+        placeholder = st.empty()
+        stream = stream_analyze_and_respond(
             user_message=message,
             user_summary=user_summary or "First-time user.",
-            turn_count=st.session_state.turn_count
+            turn_count=st.session_state.turn_count,
+            signals=signals,
+            user_id=user_id,
         )
+        shown = ""
+        for piece in stream:
+            shown += piece
+            placeholder.markdown(f"**🤍 InnerCompanion:**\n{shown}▌")
+        response, emotion = stream.response, stream.emotion
 
-    if emotion and emotion != "crisis":
-        log_emotion(emotion)
-
-    # Append to history
-    st.session_state.conversation.append(("You", message))
-    st.session_state.conversation.append(("InnerCompanion", response))
+    # Append to the session log and to the window on screen (kept at its size)
+    append_chat(
+        st.session_state.session_id, [("You", message), ("InnerCompanion", response)], user_id=user_id
+    )
+    seq = st.session_state.turn_count * 2 - 2
+    conversation = st.session_state.conversation
+    conversation += [(seq, "You", message), (seq + 1, "InnerCompanion", response)]
+    del conversation[:-st.session_state.shown]
+    metrics.observe("turn", (time.perf_counter() - turn_started) * 1000)
+    metrics.export()
 
     # Critical fix: rerun to clear the text_area (Streamlit's proper way)
     st.rerun()
@@ -100,9 +245,15 @@ if send and user_input.strip():
 # -----------------------------------------
 # Display Conversation
 # -----------------------------------------
+# Only the loaded window is drawn, so a rerun costs the same however long the chat is
 if st.session_state.conversation:
     st.markdown("---")
-    for speaker, text in st.session_state.conversation:
+    oldest = st.session_state.conversation[0][0]
+    if oldest > 0 and st.button(f"⬆️ Load earlier ({oldest} more)"):
+        earlier = load_chat(st.session_state.session_id, user_id, before=oldest)
+        st.session_state.conversation[:0] = earlier
+        st.session_state.shown += len(earlier)
+    for _, speaker, text in st.session_state.conversation:
         if speaker == "You":
             st.markdown(f"**You:** {text}")
         else:
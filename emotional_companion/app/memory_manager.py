@@ -1,74 +1,657 @@
 # app/memory_manager.py
+# Profile storage on SQLite (WAL mode), sharded by user id so that sessions of
+# different users rarely share a write lock and a read touches only one user's
+# rows. Every mutation is a small row-level write, and `turn()` groups all of
+# one chat turn's mutations into a single durable commit. Older stores
+# (user_memory.json, user_memory.db) are imported once, then left alone.
+#
+# Contexts live in a bounded store: a hash index for dedupe, a fixed-size ring
+# of hot rows for the prompt window, and a cold archive that is periodically
+# packed into compressed chunks. Emotions go to the columnar timeline in
+# emotion_timeline.py, which keeps its trend aggregates up to date on write.
 
+import hashlib
 import json
 import os
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
 
-MEMORY_FILE = "memory/user_memory.json"
+import emotion_timeline
 
-# Ensure memory folder & file exist
+MEMORY_DIR = os.getenv("INNER_VOICE_MEMORY_DIR", "memory")
+MEMORY_FILE = os.path.join(MEMORY_DIR, "user_memory.json")  # legacy JSON store
+MEMORY_DB = os.path.join(MEMORY_DIR, "user_memory.db")   # single-file store before sharding
+SHARD_DIR = os.path.join(MEMORY_DIR, "shards")
+# Users are spread over this many SQLite files; changing it remaps users,
+# so pick it once per deployment
+SHARD_COUNT = int(os.getenv("INNER_VOICE_SHARDS", "16"))
+
+CHAT_PAGE = 20                 # chat messages per page when a session is (re)opened
+CONTEXT_HOT_WINDOW = 50        # contexts kept in the ring (what load_user_profile returns)
+CONTEXT_COMPACT_EVERY = 200    # pack archived contexts into one chunk this often
+EMOTION_LOG_WINDOW = 50        # emotion entries load_user_profile returns
+# Old LLM error replies saved as contexts; dropped when the archive is compacted
+STALE_CONTEXT_MARKERS = ("hiccup: ", "Error generating response:")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    age TEXT NOT NULL DEFAULT '',
+    last_session_summary TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS context_seq (
+    user_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS context_index (
+    user_id TEXT NOT NULL,
+    digest INTEGER NOT NULL,
+    PRIMARY KEY (user_id, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS context_ring (
+    user_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (user_id, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS context_archive (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS context_chunks (
+    user_id TEXT NOT NULL,
+    first_seq INTEGER NOT NULL,
+    last_seq INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (user_id, first_seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    situation TEXT NOT NULL DEFAULT '',
+    upto_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    started TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, session_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chat_sessions_recent ON chat_sessions (user_id, updated);
+CREATE TABLE IF NOT EXISTS chat_log (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    speaker TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (user_id, session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS helpful_actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (user_id, text)
+);
+-- Row-per-entry emotion log from before the timeline; emptied on startup
+CREATE TABLE IF NOT EXISTS emotion_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    emotion TEXT NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emotion_log_user ON emotion_log (user_id, id);
+""" + emotion_timeline.TIMELINE_SCHEMA
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def configure(memory_dir):
+    """Point the store at another directory (benchmarks, tests, tools)."""
+    global MEMORY_DIR, MEMORY_FILE, MEMORY_DB, SHARD_DIR
+    MEMORY_DIR = memory_dir
+    MEMORY_FILE = os.path.join(MEMORY_DIR, "user_memory.json")
+    MEMORY_DB = os.path.join(MEMORY_DIR, "user_memory.db")
+    SHARD_DIR = os.path.join(MEMORY_DIR, "shards")
+
+
+def shard_path(user_id):
+    """Stable user -> shard mapping (crc32, so it is the same in every process)."""
+    shard = zlib.crc32(user_id.encode("utf-8")) % SHARD_COUNT
+    return os.path.join(SHARD_DIR, f"shard_{shard:02d}.db")
+
+
+def _shard_paths():
+    return [os.path.join(SHARD_DIR, f"shard_{n:02d}.db") for n in range(SHARD_COUNT)]
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    # BEGIN IMMEDIATE takes the shard's write lock up front, so concurrent
+    # sessions queue (busy timeout) instead of overwriting each other
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# Ensure memory folder & shards exist (and import older stores once)
 def init_memory():
-    if not os.path.exists("memory"):
-        os.makedirs("memory")
-    if not os.path.exists(MEMORY_FILE):
-        with open(MEMORY_FILE, "w") as f:
-            json.dump({}, f)
+    with _init_lock:
+        if SHARD_DIR in _initialized:
+            return
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        for path in _shard_paths():
+            conn = _open(path)
+            try:
+                conn.executescript(_SCHEMA)
+                _migrate_emotion_log(conn)
+            finally:
+                conn.close()
+        _import_legacy_stores()
+        _initialized.add(SHARD_DIR)
+
+
+def _legacy_profiles():
+    """Profiles from the pre-shard stores: user_memory.db if present, else user_memory.json."""
+    if os.path.exists(MEMORY_DB):
+        old = _open(MEMORY_DB)
+        try:
+            old.executescript(_SCHEMA)
+            _migrate_flat_contexts(old)
+            _migrate_emotion_log(old)
+            users = [r[0] for r in old.execute("SELECT user_id FROM profiles")]
+            return {uid: _read_profile(old, uid, _all_contexts, _all_emotions) for uid in users}
+        finally:
+            old.close()
+    if os.path.exists(MEMORY_FILE):
+        with open(MEMORY_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def _import_legacy_stores():
+    # Shard 0's write lock doubles as the migration lock across processes
+    first = _open(_shard_paths()[0])
+    try:
+        with _transaction(first):
+            if first.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone():
+                return
+            for user_id, profile in _legacy_profiles().items():
+                path = shard_path(user_id)
+                if path == _shard_paths()[0]:
+                    _replace_profile(first, user_id, profile)
+                    continue
+                conn = _open(path)
+                try:
+                    with _transaction(conn):
+                        _replace_profile(conn, user_id, profile)
+                finally:
+                    conn.close()
+            first.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', '1')")
+    finally:
+        first.close()
+
+
+# Earlier versions kept every context in one unbounded `contexts` table
+def _migrate_flat_contexts(conn):
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contexts'"
+    ).fetchone():
+        return
+    with _transaction(conn):
+        for user_id, text in conn.execute(
+            "SELECT user_id, text FROM contexts ORDER BY id"
+        ).fetchall():
+            _add_context(conn, user_id, text)
+        conn.execute("DROP TABLE contexts")
+
+
+# Earlier versions logged emotions one row each in `emotion_log`
+def _migrate_emotion_log(conn):
+    if not conn.execute("SELECT 1 FROM emotion_log LIMIT 1").fetchone():
+        return
+    with _transaction(conn):
+        for user_id, emotion, time in conn.execute(
+            "SELECT user_id, emotion, time FROM emotion_log ORDER BY id"
+        ).fetchall():
+            _append_emotion(conn, user_id, emotion, time)
+        conn.execute("DELETE FROM emotion_log")
+
+
+# One connection per thread and shard (Streamlit runs each session in its own thread)
+def _connection(user_id):
+    return _shard_connection(shard_path(user_id))
+
+
+def _shard_connection(path):
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        init_memory()
+        conn = conns[path] = _open(path)
+    return conn
+
+
+def _run(path, ops):
+    with _transaction(_shard_connection(path)) as conn:
+        for op in ops:
+            op(conn)
+
+
+# Queue a write inside the current turn, or commit it right away
+def _write(user_id, op):
+    _write_shard(shard_path(user_id), op)
+
+
+def _write_shard(path, op):
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.setdefault(path, []).append(op)
+    else:
+        _run(path, [op])
+
+
+@contextmanager
+def turn():
+    """
+    Unit of work for one chat turn: writes made inside the block are buffered
+    and committed together in one transaction per shard when it exits. If the
+    block raises, nothing is written. Reads inside the block see committed data only.
+    """
+    if getattr(_local, "pending", None) is not None:
+        yield  # nested: the outer turn commits
+        return
+    _local.pending = {}
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    for path, ops in pending.items():
+        _run(path, ops)
+
+
+# ========================
+# CONTEXT STORE
+# ========================
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def _add_context(conn, user_id, text):
+    """O(1) dedupe via the hash index, then write into the ring slot."""
+    added = conn.execute(
+        "INSERT OR IGNORE INTO context_index (user_id, digest) VALUES (?, ?)",
+        (user_id, _digest(text)),
+    ).rowcount
+    if not added:
+        return
+
+    conn.execute("INSERT OR IGNORE INTO context_seq (user_id) VALUES (?)", (user_id,))
+    conn.execute("UPDATE context_seq SET seq = seq + 1 WHERE user_id = ?", (user_id,))
+    seq = conn.execute("SELECT seq FROM context_seq WHERE user_id = ?", (user_id,)).fetchone()[0]
+    slot = seq % CONTEXT_HOT_WINDOW
+
+    evicted = conn.execute(
+        "SELECT seq, text FROM context_ring WHERE user_id = ? AND slot = ?", (user_id, slot)
+    ).fetchone()
+    if evicted:
+        conn.execute(
+            "INSERT INTO context_archive (user_id, seq, text) VALUES (?, ?, ?)",
+            (user_id, evicted[0], evicted[1]),
+        )
+        if evicted[0] % CONTEXT_COMPACT_EVERY == 0:
+            _compact_archive(conn, user_id)
+
+    conn.execute(
+        "INSERT OR REPLACE INTO context_ring (user_id, slot, seq, text) VALUES (?, ?, ?, ?)",
+        (user_id, slot, seq, text),
+    )
+
+
+def _compact_archive(conn, user_id):
+    """Pack loose archived rows into one compressed chunk, dropping stale entries."""
+    rows = conn.execute(
+        "SELECT seq, text FROM context_archive WHERE user_id = ? ORDER BY seq", (user_id,)
+    ).fetchall()
+    if not rows:
+        return
+    kept = [[seq, text] for seq, text in rows if not any(m in text for m in STALE_CONTEXT_MARKERS)]
+    if kept:
+        conn.execute(
+            "INSERT INTO context_chunks (user_id, first_seq, last_seq, payload) VALUES (?, ?, ?, ?)",
+            (user_id, rows[0][0], rows[-1][0], zlib.compress(json.dumps(kept).encode("utf-8"))),
+        )
+    conn.execute("DELETE FROM context_archive WHERE user_id = ?", (user_id,))
+
+
+def _contexts_since(conn, user_id, seq):
+    """(seq, text) pairs stored after `seq`, oldest first (usually all still in the ring)."""
+    entries = []
+    for (payload,) in conn.execute(
+        "SELECT payload FROM context_chunks WHERE user_id = ? AND last_seq > ? ORDER BY first_seq",
+        (user_id, seq),
+    ):
+        entries += [tuple(e) for e in json.loads(zlib.decompress(payload)) if e[0] > seq]
+    for table in ("context_archive", "context_ring"):
+        entries += conn.execute(
+            f"SELECT seq, text FROM {table} WHERE user_id = ? AND seq > ? ORDER BY seq", (user_id, seq)
+        ).fetchall()
+    return entries
+
+
+def _hot_contexts(conn, user_id, limit=CONTEXT_HOT_WINDOW):
+    rows = conn.execute(
+        "SELECT text FROM context_ring WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+        (user_id, limit),
+    ).fetchall()
+    return [r[0] for r in reversed(rows)]
 
 
-# Load entire memory file
+def _all_contexts(conn, user_id):
+    """Full history, oldest first: compacted chunks, loose archive, then the ring."""
+    entries = []
+    for (payload,) in conn.execute(
+        "SELECT payload FROM context_chunks WHERE user_id = ? ORDER BY first_seq", (user_id,)
+    ):
+        entries += json.loads(zlib.decompress(payload))
+    entries += conn.execute(
+        "SELECT seq, text FROM context_archive WHERE user_id = ? ORDER BY seq", (user_id,)
+    ).fetchall()
+    entries += conn.execute(
+        "SELECT seq, text FROM context_ring WHERE user_id = ? ORDER BY seq", (user_id,)
+    ).fetchall()
+    return [text for _, text in entries]
+
+
+# ========================
+# EMOTION TIMELINE
+# ========================
+def _append_emotion(conn, user_id, emotion, time):
+    """`time` is the ISO string the JSON-shaped profiles carry."""
+    try:
+        ts = datetime.fromisoformat(time).timestamp()
+    except (TypeError, ValueError):
+        return  # unparseable legacy entry
+    emotion_timeline.append(conn, user_id, emotion, ts)
+
+
+def _recent_emotions(conn, user_id, limit=EMOTION_LOG_WINDOW):
+    return emotion_timeline.recent(conn, user_id, limit)
+
+
+def _all_emotions(conn, user_id):
+    return emotion_timeline.all_entries(conn, user_id)
+
+
+# ========================
+# ROW HELPERS
+# ========================
+_USER_TABLES = (
+    "profiles", "summaries", "helpful_actions", "emotion_log",
+    "context_seq", "context_index", "context_ring", "context_archive", "context_chunks",
+) + emotion_timeline.TIMELINE_TABLES
+
+
+def _ensure_profile(conn, user_id):
+    conn.execute("INSERT OR IGNORE INTO profiles (user_id) VALUES (?)", (user_id,))
+
+
+def _replace_profile(conn, user_id, profile):
+    for table in _USER_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+    conn.execute(
+        "INSERT INTO profiles (user_id, name, age, last_session_summary) VALUES (?, ?, ?, ?)",
+        (
+            user_id,
+            profile.get("name", "") or "",
+            profile.get("age", "") or "",
+            profile.get("last_session_summary", "") or "",
+        ),
+    )
+    for context in profile.get("contexts", []):
+        _add_context(conn, user_id, context)
+    conn.executemany(
+        "INSERT OR IGNORE INTO helpful_actions (user_id, text) VALUES (?, ?)",
+        [(user_id, a) for a in profile.get("helpful_actions", [])],
+    )
+    for entry in profile.get("emotion_log", []):
+        _append_emotion(conn, user_id, entry["emotion"], entry["time"])
+
+
+def _read_profile(conn, user_id, contexts=_hot_contexts, emotions=_recent_emotions):
+    row = conn.execute(
+        "SELECT name, age, last_session_summary FROM profiles WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    name, age, summary = row if row else ("", "", "")
+    return {
+        "name": name,
+        "age": age,
+        "contexts": contexts(conn, user_id),
+        "helpful_actions": [r[0] for r in conn.execute(
+            "SELECT text FROM helpful_actions WHERE user_id = ? ORDER BY id", (user_id,))],
+        "last_session_summary": summary,
+        "emotion_log": emotions(conn, user_id),
+    }
+
+
+# ========================
+# PUBLIC API
+# ========================
+# Load entire memory (all users) as the old JSON-shaped dict
 def load_full_memory():
-    init_memory()
-    with open(MEMORY_FILE, "r") as f:
-        return json.load(f)
+    data = {}
+    for path in _shard_paths():
+        conn = _shard_connection(path)
+        for (user_id,) in conn.execute("SELECT user_id FROM profiles ORDER BY user_id").fetchall():
+            data[user_id] = _read_profile(conn, user_id, _all_contexts, _all_emotions)
+    return dict(sorted(data.items()))
 
 
-# Save entire memory file
+# Replace entire memory with a JSON-shaped dict (one transaction per shard)
 def save_full_memory(data):
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    by_shard = {path: {} for path in _shard_paths()}
+    for user_id, profile in data.items():
+        by_shard[shard_path(user_id)][user_id] = profile
+
+    for path, profiles in by_shard.items():
+        def op(conn, profiles=profiles):
+            for table in _USER_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            for user_id, profile in profiles.items():
+                _replace_profile(conn, user_id, profile)
+        _write_shard(path, op)
 
 
-# Get memory for a specific user_id
+# Get memory for a specific user_id ("contexts" and "emotion_log" hold only recent entries)
 def load_user_profile(user_id="default_user"):
-    data = load_full_memory()
-    return data.get(user_id, {
-        "name": "",
-        "age": "",
-        "contexts": [],
-        "helpful_actions": [],
-        "last_session_summary": "",
-        "emotion_log": []
-    })
+    return _read_profile(_connection(user_id), user_id)
+
+
+# Most recent contexts, oldest first (bounded read for the prompt)
+def recent_contexts(limit=10, user_id="default_user"):
+    return _hot_contexts(_connection(user_id), user_id, min(limit, CONTEXT_HOT_WINDOW))
+
+
+# Every stored context, including archived ones (not for the per-turn path)
+def all_contexts(user_id="default_user"):
+    return _all_contexts(_connection(user_id), user_id)
+
+
+# Contexts added after `seq` as (seq, text), oldest first (for the summariser)
+def contexts_since(seq, user_id="default_user"):
+    return _contexts_since(_connection(user_id), user_id, seq)
+
+
+# Rolling summaries: the current situation, and the last finished session
+def load_summaries(user_id="default_user"):
+    conn = _connection(user_id)
+    row = conn.execute(
+        "SELECT situation, upto_seq FROM summaries WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    last = conn.execute(
+        "SELECT last_session_summary FROM profiles WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    situation, upto_seq = row if row else ("", 0)
+    return {
+        "situation": situation,
+        "upto_seq": upto_seq,
+        "last_session_summary": last[0] if last else "",
+    }
+
+
+def save_summaries(situation, upto_seq, last_session_summary=None, user_id="default_user"):
+    def op(conn):
+        _ensure_profile(conn, user_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries (user_id, situation, upto_seq) VALUES (?, ?, ?)",
+            (user_id, situation, upto_seq),
+        )
+        if last_session_summary is not None:
+            conn.execute(
+                "UPDATE profiles SET last_session_summary = ? WHERE user_id = ?",
+                (last_session_summary, user_id),
+            )
+
+    _write(user_id, op)
 
 
 # Save a user's profile
 def save_user_profile(profile, user_id="default_user"):
-    data = load_full_memory()
-    data[user_id] = profile
-    save_full_memory(data)
+    _write(user_id, lambda conn: _replace_profile(conn, user_id, profile))
 
 
 # Update profile fields
-def update_user_profile(name=None, age=None, context=None, helpful_action=None):
-    profile = load_user_profile()
-
-    if name:
-        profile["name"] = name
-    if age:
-        profile["age"] = age
-    if context and context not in profile["contexts"]:
-        profile["contexts"].append(context)
-    if helpful_action and helpful_action not in profile["helpful_actions"]:
-        profile["helpful_actions"].append(helpful_action)
+def update_user_profile(name=None, age=None, context=None, helpful_action=None, user_id="default_user"):
+    def op(conn):
+        _ensure_profile(conn, user_id)
+        if name:
+            conn.execute("UPDATE profiles SET name = ? WHERE user_id = ?", (name, user_id))
+        if age:
+            conn.execute("UPDATE profiles SET age = ? WHERE user_id = ?", (age, user_id))
+        if context:
+            _add_context(conn, user_id, context)
+        if helpful_action:
+            conn.execute(
+                "INSERT OR IGNORE INTO helpful_actions (user_id, text) VALUES (?, ?)",
+                (user_id, helpful_action),
+            )
 
-    save_user_profile(profile)
+    _write(user_id, op)
 
 
 # Add an emotion log entry
-def log_emotion(emotion):
-    profile = load_user_profile()
-    profile["emotion_log"].append({
-        "emotion": emotion,
-        "time": datetime.now().isoformat()
-    })
-    save_user_profile(profile)
+def log_emotion(emotion, user_id="default_user"):
+    ts = datetime.now().timestamp()
+
+    def op(conn):
+        _ensure_profile(conn, user_id)
+        emotion_timeline.append(conn, user_id, emotion, ts)
+
+    _write(user_id, op)
+
+
+# Cheap change marker for a user's shard (file sizes + mtimes, no SQL): any
+# committed write changes it, so callers can cache values derived from a profile
+def profile_version(user_id="default_user"):
+    path = shard_path(user_id)
+    version = []
+    for name in (path, path + "-wal"):
+        try:
+            st = os.stat(name)
+            version += [st.st_mtime_ns, st.st_size]
+        except FileNotFoundError:
+            version += [0, 0]
+    return tuple(version)
+
+
+# Counts per emotion for the last `periods` days or weeks (reads one row per bucket)
+def emotion_trend(user_id="default_user", unit="day", periods=14):
+    return emotion_timeline.trend(_connection(user_id), user_id, unit, periods)
+
+
+# Totals, streaks and the recent emotion mix
+def emotion_summary(user_id="default_user"):
+    return emotion_timeline.summary(_connection(user_id), user_id)
+
+
+# ========================
+# CHAT SESSIONS (APPEND-ONLY LOG)
+# ========================
+# What the UI shows, message by message; kept apart from the profile, so
+# save_user_profile / save_full_memory never touch it.
+def append_chat(session_id, messages, user_id="default_user"):
+    """Append (speaker, text) pairs to the session log in one write."""
+    now = datetime.now().isoformat()
+
+    def op(conn):
+        conn.execute(
+            "INSERT OR IGNORE INTO chat_sessions (user_id, session_id, started, updated) VALUES (?, ?, ?, ?)",
+            (user_id, session_id, now, now),
+        )
+        count = conn.execute(
+            "SELECT messages FROM chat_sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+        ).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO chat_log (user_id, session_id, seq, speaker, text) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, session_id, count + i, speaker, text) for i, (speaker, text) in enumerate(messages)],
+        )
+        conn.execute(
+            "UPDATE chat_sessions SET updated = ?, messages = ? WHERE user_id = ? AND session_id = ?",
+            (now, count + len(messages), user_id, session_id),
+        )
+
+    _write(user_id, op)
+
+
+# Up to `limit` messages before `before` (default: the newest), as (seq, speaker, text), oldest first
+def load_chat(session_id, user_id="default_user", before=None, limit=CHAT_PAGE):
+    rows = _connection(user_id).execute(
+        "SELECT seq, speaker, text FROM chat_log WHERE user_id = ? AND session_id = ? AND seq < ?"
+        " ORDER BY seq DESC LIMIT ?",
+        (user_id, session_id, before if before is not None else 2**62, limit),
+    ).fetchall()
+    return rows[::-1]
+
+
+# Number of messages logged in a session (0 for a new one)
+def chat_length(session_id, user_id="default_user"):
+    row = _connection(user_id).execute(
+        "SELECT messages FROM chat_sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+# The session the user wrote in last, or None
+def latest_session(user_id="default_user"):
+    row = _connection(user_id).execute(
+        "SELECT session_id FROM chat_sessions WHERE user_id = ? ORDER BY updated DESC LIMIT 1", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
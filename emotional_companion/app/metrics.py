@@ -0,0 +1,184 @@
+# app/metrics.py - LIGHTWEIGHT TIMING SPANS + IN-PROCESS METRICS REGISTRY
+# Spans time each stage of a turn into fixed-bucket histograms; counters track
+# events like fallbacks and safety-mode hits; gauges hold current levels such
+# as queue depth. Collection is off by default:
+# span() then hands back one shared no-op context manager, so instrumented
+# code pays about one attribute check per stage.
+#
+# Enable with INNER_VOICE_METRICS=1 (or the sidebar toggle in main.py). Set
+# INNER_VOICE_METRICS_SINK to a *.prom path for Prometheus text, or any other
+# path for JSONL snapshots appended after each turn.
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+METRICS_ENABLED = os.getenv("INNER_VOICE_METRICS", "0") == "1"
+METRICS_SINK = os.getenv("INNER_VOICE_METRICS_SINK", "")
+
+# Upper bounds in milliseconds
+BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, 30000, float("inf"),
+)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        """Bucket upper bound holding the q-th observation (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= target:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry: "MetricsRegistry", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name: str, ms: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def inc(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[name] = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    # ---- export ----
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                "time": time.time(),
+                "stages": {name: h.summary() for name, h in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = [
+            "# HELP inner_voice_stage_seconds Time spent in each turn stage.",
+            "# TYPE inner_voice_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS_MS, hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                    lines.append(f'inner_voice_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'inner_voice_stage_seconds_sum{{stage="{name}"}} {hist.total_ms / 1000:.6f}')
+                lines.append(f'inner_voice_stage_seconds_count{{stage="{name}"}} {hist.count}')
+            lines.append("# HELP inner_voice_events_total Turn events (paths, fallbacks, safety hits).")
+            lines.append("# TYPE inner_voice_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'inner_voice_events_total{{event="{name}"}} {value}')
+            lines.append("# HELP inner_voice_level Current levels (queue depth, running calls).")
+            lines.append("# TYPE inner_voice_level gauge")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f'inner_voice_level{{name="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Optional[str] = None) -> None:
+        """Write to the sink: Prometheus text for *.prom, else append one JSONL snapshot."""
+        path = path or METRICS_SINK
+        if not path or not self.enabled:
+            return
+        if path.endswith(".prom"):
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp, path)
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot()) + "\n")
+
+
+metrics = MetricsRegistry()
+span = metrics.span
+inc = metrics.inc
@@ -0,0 +1,164 @@
+# app/response_cache.py - PERSISTENT LLM RESPONSE CACHE
+# Replies are keyed by model, phase, the normalised message and a small stable
+# context (the user's profile line and detected emotion), so near-identical
+# openers ("Hii", "I am feeling lonely today") reuse an earlier reply, also
+# for a user who repeats themselves. Recalled memory and the rolling summaries
+# are left out of the key: they change every turn. Two tiers: an in-process LRU with TTL, and a SQLite file that
+# survives Streamlit restarts. Each key keeps a few reply variants.
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import memory_manager
+
+CACHE_ENABLED = os.getenv("INNER_VOICE_RESPONSE_CACHE", "1") != "0"
+CACHE_MAX_ENTRIES = 512                                             # in-memory LRU size
+CACHE_TTL = float(os.getenv("INNER_VOICE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CACHE_VARIANTS = 3          # replies kept per key
+CACHE_EXPLORE = 0.3         # chance of asking the model for another variant while < CACHE_VARIANTS
+
+# Words that don't change what the user is saying for reply purposes
+FILLER_WORDS = {"today", "now", "really", "very", "so", "just", "please", "like", "um", "uh"}
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_REPEATS = re.compile(r"([a-z])\1+")
+
+
+def normalise_message(message: str) -> str:
+    """"Hii!!", "hi" and "Hi " all map to "hi"."""
+    text = _NON_WORD.sub(" ", message.lower().replace("'", ""))
+    text = _REPEATS.sub(r"\1", text)
+    return " ".join(w for w in text.split() if w not in FILLER_WORDS)
+
+
+def _cache_path() -> str:
+    return os.path.join(memory_manager.MEMORY_DIR, "response_cache.db")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL,
+        variants: int = CACHE_VARIANTS,
+        explore: float = CACHE_EXPLORE,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.explore = explore
+        self._lru: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.explores = 0
+
+    @staticmethod
+    def key(model: str, phase: str, message: str, context: str = "") -> str:
+        raw = "\x1f".join((model, phase, normalise_message(message), context))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # ---- disk tier ----
+    def _db(self) -> sqlite3.Connection:
+        path = _cache_path()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.path != path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT NOT NULL, raw TEXT NOT NULL, stored_at REAL NOT NULL,"
+                " PRIMARY KEY (key, raw))"
+            )
+            self._local.conn = conn
+            self._local.path = path
+        return conn
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[float, List[str]]]:
+        rows = self._db().execute(
+            "SELECT raw, stored_at FROM responses WHERE key = ? AND stored_at > ? ORDER BY stored_at",
+            (key, now - self.ttl),
+        ).fetchall()
+        if not rows:
+            return None
+        return rows[0][1], [r[0] for r in rows][-self.variants:]
+
+    # ---- public API ----
+    def get(self, model: str, phase: str, message: str, context: str = "") -> Optional[str]:
+        """Raw cached reply (tag included), or None on a miss."""
+        if not CACHE_ENABLED:
+            return None
+        key = self.key(model, phase, message, context)
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and now - entry[0] > self.ttl:
+                del self._lru[key]
+                entry = None
+            if entry:
+                self._lru.move_to_end(key)
+        from_disk = False
+        if entry is None:
+            entry = self._load(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            from_disk = True
+            self._remember(key, entry)
+
+        stored_at, variants = entry
+        if len(variants) < self.variants and random.random() < self.explore:
+            self.explores += 1  # let the model add another variant
+            return None
+        self.hits += 1
+        if from_disk:
+            self.disk_hits += 1
+        return random.choice(variants)
+
+    def put(self, model: str, phase: str, message: str, raw: str, context: str = "") -> None:
+        if not CACHE_ENABLED or not raw:
+            return
+        key = self.key(model, phase, message, context)
+        now = time.time()
+        with self._lock:
+            stored_at, variants = self._lru.get(key, (now, []))
+            if raw not in variants:
+                variants = (variants + [raw])[-self.variants:]
+        self._remember(key, (stored_at, variants))
+        conn = self._db()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, raw, stored_at) VALUES (?, ?, ?)", (key, raw, now)
+        )
+        conn.execute(
+            "DELETE FROM responses WHERE key = ? AND raw NOT IN"
+            " (SELECT raw FROM responses WHERE key = ? ORDER BY stored_at DESC LIMIT ?)",
+            (key, key, self.variants),
+        )
+
+    def _remember(self, key: str, entry: Tuple[float, List[str]]) -> None:
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "explores": self.explores,
+            "entries": len(self._lru),
+        }
+
+
+response_cache = ResponseCache()
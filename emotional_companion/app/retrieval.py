@@ -0,0 +1,200 @@
+# app/retrieval.py - RETRIEVAL MEMORY FOR THE PROMPT
+# Each stored turn is embedded locally with hashed word + character n-gram
+# features (no model download, no network) and kept in a per-user index:
+# faiss-cpu when installed, a plain Python scan otherwise. At prompt time the
+# most relevant past turns are picked under a token budget, so the prompt
+# stays the same size no matter how long someone has been talking. faiss is
+# only imported when the first index is built, not at app start.
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from memory_manager import all_contexts
+
+faiss = None
+np = None
+_faiss_checked = False
+
+EMBED_DIM = 512
+MEMORY_TOP_K = 4
+MEMORY_TOKEN_BUDGET = 160      # tokens of past turns allowed into one prompt
+MEMORY_MIN_SCORE = 0.15        # cosine similarity below this is noise
+MAX_INDEXED_TURNS = 5000       # per user; oldest turns drop out of the index
+MAX_CACHED_USERS = 64          # per-user indexes kept in this process
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+# ========================
+# TOKEN COUNTING
+# ========================
+_encoder = None
+_encoder_failed = False
+
+
+def token_count(text: str) -> int:
+    """tiktoken's cl100k_base when available offline, else ~4 characters per token."""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder_failed = True  # not installed, or the BPE file can't be fetched
+    if _encoder is not None:
+        return len(_encoder.encode(text))
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _load_faiss():
+    """faiss-cpu + numpy when installed (optional: else the pure-Python scan)."""
+    global faiss, np, _faiss_checked
+    if not _faiss_checked:
+        try:
+            import faiss as faiss_module
+            import numpy as numpy_module
+
+            faiss, np = faiss_module, numpy_module
+        except ImportError:
+            pass
+        _faiss_checked = True
+    return faiss
+
+
+# ========================
+# EMBEDDING
+# ========================
+def _bucket(feature: str) -> Tuple[int, float]:
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big")
+    return h % EMBED_DIM, (1.0 if h & 0x80000000 else -1.0)
+
+
+def embed(text: str) -> Dict[int, float]:
+    """Sparse, L2-normalised hashed n-gram vector {dimension: weight}."""
+    words = _WORD.findall(text.lower())
+    features = list(words)
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"#{w}#"
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vec: Dict[int, float] = {}
+    for feature in features:
+        dim, sign = _bucket(feature)
+        vec[dim] = vec.get(dim, 0.0) + sign
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {d: v / norm for d, v in vec.items()}
+
+
+def _dense(vec: Dict[int, float]):
+    row = np.zeros(EMBED_DIM, dtype="float32")
+    for d, v in vec.items():
+        row[d] = v
+    return row
+
+
+# ========================
+# PER-USER INDEX
+# ========================
+class MemoryIndex:
+    def __init__(self):
+        self.texts: List[str] = []
+        self._seen = set()
+        self._vectors: List[Dict[int, float]] = []
+        self._faiss = faiss.IndexFlatIP(EMBED_DIM) if _load_faiss() is not None else None
+        self._lock = threading.Lock()
+
+    def add(self, text: str) -> None:
+        with self._lock:
+            if text in self._seen:
+                return
+            if len(self.texts) >= MAX_INDEXED_TURNS:
+                self._rebuild(self.texts[len(self.texts) // 2:])
+            self._add(text)
+
+    def _add(self, text: str) -> None:
+        vec = embed(text)
+        self.texts.append(text)
+        self._seen.add(text)
+        if self._faiss is not None:
+            self._faiss.add(_dense(vec).reshape(1, -1))
+        else:
+            self._vectors.append(vec)
+
+    def _rebuild(self, texts: List[str]) -> None:
+        self.texts, self._seen, self._vectors = [], set(), []
+        if self._faiss is not None:
+            self._faiss.reset()
+        for text in texts:
+            self._add(text)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, int]]:
+        """(score, position) of the k most similar turns, best first."""
+        qvec = embed(query)
+        with self._lock:
+            if not self.texts:
+                return []
+            if self._faiss is not None:
+                scores, ids = self._faiss.search(_dense(qvec).reshape(1, -1), min(k, len(self.texts)))
+                return [(float(s), int(i)) for s, i in zip(scores[0], ids[0]) if i >= 0]
+            scored = [
+                (sum(w * vec.get(d, 0.0) for d, w in qvec.items()), i)
+                for i, vec in enumerate(self._vectors)
+            ]
+        scored.sort(reverse=True)
+        return scored[:k]
+
+
+_indexes: "OrderedDict[str, MemoryIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _index_for(user_id: str) -> MemoryIndex:
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+            return index
+    # First use in this process: embed the stored history once
+    index = MemoryIndex()
+    for text in all_contexts(user_id)[-MAX_INDEXED_TURNS:]:
+        index.add(text)
+    with _indexes_lock:
+        index = _indexes.setdefault(user_id, index)
+        while len(_indexes) > MAX_CACHED_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def remember(user_id: str, *texts: str) -> None:
+    """Add freshly stored turns to the user's index (if it is loaded)."""
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+    if index is not None:
+        for text in texts:
+            index.add(text)
+
+
+def recall(
+    user_id: str,
+    query: str,
+    k: int = MEMORY_TOP_K,
+    budget: int = MEMORY_TOKEN_BUDGET,
+    min_score: float = MEMORY_MIN_SCORE,
+) -> str:
+    """Relevant past turns for the prompt, oldest first, within `budget` tokens."""
+    index = _index_for(user_id)
+    picked: List[int] = []
+    used = 0
+    for score, pos in index.search(query, k):
+        if score < min_score:
+            break
+        cost = token_count(index.texts[pos]) + 2
+        if used + cost > budget:
+            continue
+        picked.append(pos)
+        used += cost
+    return "\n".join(f"- {index.texts[pos]}" for pos in sorted(picked))
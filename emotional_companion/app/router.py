@@ -0,0 +1,159 @@
+# app/router.py - LATENCY-AWARE ROUTING BETWEEN LOCAL MODELS
+# Several Ollama models of different sizes can serve turns (INNER_VOICE_MODELS,
+# largest first). Light turns (a short "Hii", a closing "thank you, that's
+# all") go to the smallest; everything else to the largest, unless it breaks
+# the latency SLO: too many calls waiting, an expected reply time (EWMA of
+# time-to-first-token + budget / EWMA of tokens per second) over the SLO, a
+# cold model or recent failures. Then the turn is demoted to the next smaller
+# model that fits. Stats older than ROUTER_STALE count as unknown, so a
+# demoted model gets traffic again and can prove it has recovered.
+#
+# With one model configured (the default) every turn goes to it.
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from detectors import MessageSignals
+from llm_client import DEFAULT_MODEL, MODELS
+from metrics import inc, metrics
+from scheduler import scheduler
+from warmup import warmup
+
+ROUTER_MODELS = MODELS
+ROUTER_SLO_MS = float(os.getenv("INNER_VOICE_ROUTER_SLO_MS", "5000"))   # expected full reply time
+ROUTER_QUEUE_SLO = int(os.getenv("INNER_VOICE_ROUTER_QUEUE_SLO", "0")) or scheduler.parallel
+EWMA_ALPHA = 0.3               # weight of the newest sample
+ROUTER_STALE = 60.0            # seconds without samples before a model's stats are ignored
+FAILURE_COOLDOWN = 60.0        # seconds a model is skipped after a failed call
+LIGHT_WORDS = 4                # messages this short (and calm) are light turns
+DECISION_LOG = 200             # recent decisions kept for diagnostics
+
+
+class ModelStats:
+    __slots__ = ("ttft_ms", "tps", "last_sample", "in_flight", "failed_until", "routed")
+
+    def __init__(self):
+        self.ttft_ms: Optional[float] = None
+        self.tps: Optional[float] = None
+        self.last_sample = 0.0
+        self.in_flight = 0
+        self.failed_until = 0.0
+        self.routed = 0
+
+    def expected_ms(self, tokens: int, now: float) -> Optional[float]:
+        """Predicted time for a `tokens`-long reply; None while unknown or stale."""
+        if self.ttft_ms is None or now - self.last_sample > ROUTER_STALE:
+            return None
+        return self.ttft_ms + (tokens / self.tps * 1000 if self.tps else 0.0)
+
+
+def _ewma(old: Optional[float], new: float) -> float:
+    return new if old is None else old + EWMA_ALPHA * (new - old)
+
+
+class ModelRouter:
+    def __init__(self, models: List[str] = ROUTER_MODELS, slo_ms: float = ROUTER_SLO_MS,
+                 queue_slo: int = ROUTER_QUEUE_SLO):
+        self.models = list(models) or [DEFAULT_MODEL]
+        self.slo_ms = slo_ms
+        self.queue_slo = queue_slo
+        self._stats: Dict[str, ModelStats] = {m: ModelStats() for m in self.models}
+        self._lock = threading.Lock()
+        self.decisions: Deque[dict] = deque(maxlen=DECISION_LOG)
+
+    # ---- decision ----
+    def _breach(self, model: str, tokens: int, now: float) -> Optional[str]:
+        """Why `model` can't take this turn within the SLO, or None if it can."""
+        stats = self._stats[model]
+        if stats.failed_until > now:
+            return "failing"
+        if model == warmup.model and warmup.applies and not warmup.is_warm():
+            return "cold"
+        if model == self.models[0] and stats.in_flight + scheduler.queued() >= self.queue_slo:
+            return "queue"
+        expected = stats.expected_ms(tokens, now)
+        if expected is not None and expected > self.slo_ms:
+            return "slow"
+        return None
+
+    def choose(self, signals: MessageSignals, kind: str, message: str, tokens: int) -> str:
+        """Model for this turn; `kind` is the phase kind, `tokens` its generation budget."""
+        if len(self.models) == 1:
+            return self.models[0]
+        now = time.monotonic()
+        light = kind == "closing" or (
+            len(message.split()) <= LIGHT_WORDS
+            and not (signals.distress or signals.comfort)
+            and signals.risk_level == "normal"
+        )
+        # Light turns try the smallest model first, the rest the largest
+        order = self.models[::-1] if light else self.models
+        with self._lock:
+            model, reason = order[0], "light" if light else "default"
+            breach = self._breach(model, tokens, now)
+            if breach:
+                # Next model in line that fits (for a normal turn: the largest smaller one),
+                # else the smallest one that isn't failing, else the smallest
+                breaches = {m: breach if m == model else self._breach(m, tokens, now) for m in self.models}
+                fits = [m for m in order[1:] if breaches[m] is None]
+                working = [m for m in self.models[::-1] if breaches[m] != "failing"]
+                model, reason = (fits or working or self.models[-1:])[0], breach
+            self._stats[model].routed += 1
+            self.decisions.append({"model": model, "reason": reason, "kind": kind, "at": time.time()})
+        inc(f"route_{reason}")
+        inc(f"route_to_{model}")
+        return model
+
+    # ---- feedback ----
+    def started(self, model: str) -> None:
+        with self._lock:
+            if model in self._stats:
+                self._stats[model].in_flight += 1
+
+    def observe(self, model: str, ttft_ms: float, tokens: int, seconds: float) -> None:
+        """A finished call: first-token latency and generation speed."""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                return
+            stats.ttft_ms = _ewma(stats.ttft_ms, ttft_ms)
+            if tokens > 1 and seconds > 0:
+                stats.tps = _ewma(stats.tps, (tokens - 1) / seconds)
+            stats.last_sample = time.monotonic()
+            tps = stats.tps
+        metrics.observe(f"llm_ttft_{model}", ttft_ms)
+        if tps:
+            metrics.gauge(f"llm_tps_{model}", round(tps, 1))
+
+    def failed(self, model: str) -> None:
+        with self._lock:
+            if model in self._stats:
+                self._stats[model].failed_until = time.monotonic() + FAILURE_COOLDOWN
+        inc(f"route_failed_{model}")
+
+    def done(self, model: str) -> None:
+        """The call is over (finished, failed or cancelled)."""
+        with self._lock:
+            if model in self._stats:
+                self._stats[model].in_flight = max(0, self._stats[model].in_flight - 1)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                m: {
+                    "ttft_ms": round(s.ttft_ms, 1) if s.ttft_ms is not None else None,
+                    "tokens_per_s": round(s.tps, 1) if s.tps else None,
+                    "in_flight": s.in_flight,
+                    "routed": s.routed,
+                    "failing": s.failed_until > now,
+                }
+                for m, s in self._stats.items()
+            }
+            recent: List[Tuple[str, str]] = [(d["model"], d["reason"]) for d in list(self.decisions)[-10:]]
+        return {"slo_ms": self.slo_ms, "queue_slo": self.queue_slo, "models": models, "recent": recent}
+
+
+router = ModelRouter()
@@ -1,15 +1,8 @@
 # app/safety.py
-CRISIS_KEYWORDS = [
-    "suicide", "kill myself", "end my life", "want to die", "hurt myself",
-    "i can't go on", "self harm", "overdose", "i'll kill myself"
-]
+from detectors import classify
 
 def detect_crisis(text: str) -> bool:
-    t = text.lower()
-    for kw in CRISIS_KEYWORDS:
-        if kw in t:
-            return True
-    return False
+    return classify(text).crisis
 
 def safety_response():
     # IMPORTANT: replace with local hotline or show contact
@@ -0,0 +1,141 @@
+# app/scheduler.py - PRIORITY + FAIR-SHARE SCHEDULER FOR OLLAMA CALLS
+# Every LLM call of the process goes through one queue served by as many
+# worker threads as Ollama runs requests in parallel. Turns where the user is
+# struggling or asked for comfort go first, closing turns (short replies) next,
+# routine turns last. Inside a class users take turns round-robin, so one busy
+# session cannot crowd out the others, and a long wait slowly raises a turn's
+# class so routine chats are never starved.
+#
+# High-risk turns never reach the scheduler: they are answered by the safety
+# template before any model call.
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List
+
+from metrics import metrics
+
+PRIORITY_URGENT = 0     # distress or an explicit comfort request
+PRIORITY_CLOSING = 1    # the user is wrapping up; short generation
+PRIORITY_ROUTINE = 2
+PRIORITY_BACKGROUND = 3  # summaries and other work nobody is waiting for
+PRIORITY_NAMES = ("urgent", "closing", "routine", "background")
+
+# Match Ollama's own OLLAMA_NUM_PARALLEL: more workers would only queue inside Ollama
+LLM_PARALLEL = int(os.getenv("INNER_VOICE_LLM_PARALLEL", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+PRIORITY_AGING = 15.0   # seconds of waiting that lift a call one class
+
+
+class _Job:
+    __slots__ = ("fn", "priority", "user_id", "enqueued_at")
+
+    def __init__(self, fn: Callable[[], None], priority: int, user_id: str):
+        self.fn = fn
+        self.priority = priority
+        self.user_id = user_id
+        self.enqueued_at = time.perf_counter()
+
+
+class LLMScheduler:
+    def __init__(self, parallel: int = LLM_PARALLEL, aging: float = PRIORITY_AGING):
+        self.parallel = max(1, parallel)
+        self.aging = aging
+        self._cond = threading.Condition()
+        # One round-robin ring of users per class: user_id -> their waiting jobs
+        self._queues: List["OrderedDict[str, Deque[_Job]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._depth = [0] * len(PRIORITY_NAMES)
+        self._threads: List[threading.Thread] = []
+        self.running = 0
+        self.peak_depth = 0
+        self.served = [0] * len(PRIORITY_NAMES)
+
+    def submit(
+        self, fn: Callable[[], None], priority: int = PRIORITY_ROUTINE, user_id: str = "default_user"
+    ) -> None:
+        job = _Job(fn, priority, user_id)
+        with self._cond:
+            self._queues[priority].setdefault(user_id, deque()).append(job)
+            self._depth[priority] += 1
+            self.peak_depth = max(self.peak_depth, sum(self._depth))
+            self._publish()
+            while len(self._threads) < self.parallel:
+                thread = threading.Thread(
+                    target=self._worker, name=f"llm-worker-{len(self._threads)}", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+
+    def _pick(self) -> _Job:
+        """Best effective class (aging included); round-robin order within it."""
+        now = time.perf_counter()
+        best_key, best = None, None
+        for cls, users in enumerate(self._queues):
+            for position, (user_id, jobs) in enumerate(users.items()):
+                waited = now - jobs[0].enqueued_at
+                rank = max(0, cls - int(waited // self.aging)) if self.aging > 0 else cls
+                key = (rank, cls, position)
+                if best_key is None or key < best_key:
+                    best_key, best = key, (cls, user_id)
+            if best_key is not None and best_key[0] == 0:
+                break  # nothing can beat an urgent-rank head
+        cls, user_id = best
+        jobs = self._queues[cls][user_id]
+        job = jobs.popleft()
+        if jobs:
+            self._queues[cls].move_to_end(user_id)  # this user goes to the back of the ring
+        else:
+            del self._queues[cls][user_id]
+        self._depth[cls] -= 1
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not sum(self._depth):
+                    self._cond.wait()
+                job = self._pick()
+                self.running += 1
+                self.served[job.priority] += 1
+                self._publish()
+            metrics.observe(
+                f"llm_queue_wait_{PRIORITY_NAMES[job.priority]}",
+                (time.perf_counter() - job.enqueued_at) * 1000,
+            )
+            try:
+                job.fn()
+            except Exception as e:  # jobs report their own errors; keep the worker alive
+                print(f"⚠️ LLM job failed: {e}")
+            finally:
+                with self._cond:
+                    self.running -= 1
+                    self._publish()
+
+    def queued(self) -> int:
+        """Calls waiting for a worker (a cheap read for routing decisions)."""
+        return sum(self._depth)
+
+    def idle(self) -> bool:
+        """Nothing running or waiting (a good moment for background work)."""
+        with self._cond:
+            return not self.running and not sum(self._depth)
+
+    def _publish(self) -> None:
+        for cls, name in enumerate(PRIORITY_NAMES):
+            metrics.gauge(f"llm_queue_depth_{name}", self._depth[cls])
+        metrics.gauge("llm_running", self.running)
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "parallel": self.parallel,
+                "running": self.running,
+                "queued": dict(zip(PRIORITY_NAMES, self._depth)),
+                "peak_queued": self.peak_depth,
+                "served": dict(zip(PRIORITY_NAMES, self.served)),
+                "users_waiting": len({u for users in self._queues for u in users}),
+            }
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,246 @@
+# app/summariser.py - BACKGROUND CONVERSATION SUMMARIES
+# Older turns are folded into two short texts per user, so the prompt carries
+# a fixed-size summary instead of a growing history:
+#   situation              - rolling summary of the conversation going on now
+#   last_session_summary   - the situation summary as it stood when the user
+#                            last wrapped up ("that's enough", "end this", ...)
+#
+# Turns only mark a user as dirty; one daemon thread does the work while the
+# LLM scheduler is idle, so summaries never take a slot from a waiting turn.
+# The model writes them when it is reachable, otherwise an extractive summary
+# of the user's own sentences is kept.
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from detectors import classify
+from llm_client import registry as llm_registry
+from memory_manager import contexts_since, load_summaries, save_summaries
+from metrics import inc, span
+from retrieval import token_count
+from router import router
+from scheduler import PRIORITY_BACKGROUND, scheduler
+
+SUMMARIES_ENABLED = os.getenv("INNER_VOICE_SUMMARIES", "1") != "0"
+SUMMARY_EVERY = 3              # turns between situation updates (closing turns always update)
+SUMMARY_TOKEN_BUDGET = 80      # per summary; the prompt block is at most twice this
+SUMMARY_IDLE_POLL = 0.5        # seconds between scheduler checks while it is busy
+SUMMARY_TIMEOUT = 60.0         # give up on a model summary after this long
+SUMMARY_CHUNK_TOKENS = 600     # new conversation lines folded in per pass; a long backlog takes several
+
+SUMMARY_PROMPT = """You keep a short running note of what a person has told their inner voice.
+
+Current note:
+{summary}
+
+New lines of the conversation:
+{lines}
+
+Rewrite the note in at most 3 short sentences (under 50 words). Keep only what the
+person actually said: the situation, how they feel, what helped. No advice, no guesses.
+Note:"""
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+# ========================
+# SUMMARY TEXT
+# ========================
+def _clip(text: str, budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Whole sentences (or words, for one long sentence) up to `budget` tokens."""
+    text = " ".join(text.split())
+    if token_count(text) <= budget:
+        return text
+    kept = ""
+    for sentence in _SENTENCE.split(text):
+        candidate = f"{kept} {sentence}".strip()
+        if token_count(candidate) > budget:
+            break
+        kept = candidate
+    if not kept:
+        words = text.split()
+        while words and token_count(" ".join(words)) > budget:
+            words.pop()
+        kept = " ".join(words)
+    return kept
+
+
+def _user_sentences(lines: List[str]) -> List[str]:
+    return [line[len("User: "):].strip() for line in lines if line.startswith("User: ") and line[6:].strip()]
+
+
+def extractive_summary(previous: str, lines: List[str], budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """
+    Offline summary: the user's own sentences, the emotionally loaded ones
+    first and the newest among equals, kept in conversation order.
+    """
+    sentences = [s for s in _SENTENCE.split(previous) if s] + _user_sentences(lines)
+    ranked = []
+    for position, sentence in enumerate(sentences):
+        signals = classify(sentence)
+        weight = 2 * (signals.distress or signals.comfort) + (signals.emotion != "default")
+        ranked.append((weight, position, sentence))
+    ranked.sort(key=lambda r: (-r[0], -r[1]))
+
+    chosen, used = [], 0
+    for weight, position, sentence in ranked:
+        sentence = sentence if sentence[-1] in ".!?" else sentence + "."
+        cost = token_count(sentence) + 1
+        if used + cost > budget:
+            continue
+        chosen.append((position, sentence))
+        used += cost
+    return " ".join(s for _, s in sorted(chosen))
+
+
+def _build_summary_chain(llm):
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    llm = llm.bind(num_predict=SUMMARY_TOKEN_BUDGET)
+    return PromptTemplate.from_template(SUMMARY_PROMPT) | llm | StrOutputParser()
+
+
+def _model_summary(previous: str, lines: List[str]) -> Optional[str]:
+    """Summary from the model through the scheduler's background class; None if unavailable."""
+    model = router.models[-1]  # the smallest configured model is plenty for a summary
+    chain = llm_registry.get_chain(_build_summary_chain, model, "summary", allow_forced=False)
+    if chain is None:
+        return None
+    done = threading.Event()
+    result: List[Optional[str]] = [None]
+
+    def call():
+        try:
+            result[0] = chain.invoke({"summary": previous or "Nothing yet.", "lines": "\n".join(lines)})
+            llm_registry.record_success()
+        except Exception as e:
+            llm_registry.record_failure(e)
+            print(f"⚠️ Summary by model failed, keeping it extractive: {e}")
+        finally:
+            done.set()
+
+    scheduler.submit(call, PRIORITY_BACKGROUND, "__summariser__")
+    if not done.wait(SUMMARY_TIMEOUT):
+        return None
+    return result[0].strip() if result[0] else None
+
+
+def _chunk(entries: List[Tuple[int, str]], budget: int = SUMMARY_CHUNK_TOKENS) -> List[Tuple[int, str]]:
+    """The oldest entries that fit `budget` tokens (always at least one)."""
+    used = 0
+    for i, (_, text) in enumerate(entries):
+        used += token_count(text)
+        if used > budget and i:
+            return entries[:i]
+    return entries
+
+
+def summary_block(summaries: dict) -> str:
+    """The fixed-size text that goes into the prompt."""
+    parts = []
+    if summaries.get("last_session_summary"):
+        parts.append(f"Last time: {summaries['last_session_summary']}")
+    if summaries.get("situation"):
+        parts.append(f"So far: {summaries['situation']}")
+    return " ".join(parts)
+
+
+# ========================
+# BACKGROUND WORKER
+# ========================
+class SessionSummariser:
+    def __init__(self, every: int = SUMMARY_EVERY, poll: float = SUMMARY_IDLE_POLL):
+        self.every = every
+        self.poll = poll
+        self._cond = threading.Condition()
+        # user_id -> (turns since their last summary, a closing turn is among them)
+        self._pending: "OrderedDict[str, Tuple[int, bool]]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self.summarised = 0
+
+    def note_turn(self, user_id: str, closing: bool = False) -> None:
+        """Called after each stored turn; cheap, never blocks on the model."""
+        if not SUMMARIES_ENABLED:
+            return
+        with self._cond:
+            turns, closed = self._pending.get(user_id, (0, False))
+            self._pending[user_id] = (turns + 1, closed or closing)
+            self._wake()
+
+    def _wake(self) -> None:
+        # (called with self._cond held)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="summariser", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _requeue(self, user_id: str, closing: bool) -> None:
+        """More stored turns than one pass takes: run the user again next."""
+        with self._cond:
+            turns, closed = self._pending.pop(user_id, (0, False))
+            self._pending[user_id] = (max(turns, self.every), closed or closing)
+            self._wake()
+
+    def _ready(self) -> Optional[Tuple[str, bool]]:
+        for user_id, (turns, closing) in self._pending.items():
+            if closing or turns >= self.every:
+                del self._pending[user_id]
+                return user_id, closing
+        return None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                job = self._ready()
+                while job is None:
+                    self._cond.wait()
+                    job = self._ready()
+            # Off the hot path: wait until no turn is running or queued
+            while not scheduler.idle():
+                time.sleep(self.poll)
+            try:
+                self.summarise(*job)
+            except Exception as e:
+                print(f"⚠️ Summary failed for {job[0]}: {e}")
+
+    def summarise(self, user_id: str, closing: bool = False) -> dict:
+        """
+        Fold the oldest turns stored since the last run (one chunk of them) into
+        the user's summaries; the rest, if any, is left to the next pass.
+        """
+        with span("summarise"):
+            state = load_summaries(user_id)
+            new = contexts_since(state["upto_seq"], user_id)
+            situation = state["situation"]
+            chunk = _chunk(new)
+            behind = len(chunk) < len(new)
+            if chunk:
+                lines = [text for _, text in chunk]
+                model = _model_summary(situation, lines)
+                inc("summary_model" if model else "summary_extractive")
+                situation = _clip(model) if model else extractive_summary(situation, lines)
+                state["upto_seq"] = chunk[-1][0]
+            if behind:
+                save_summaries(situation, state["upto_seq"], user_id=user_id)
+                self._requeue(user_id, closing)  # the session closes once its last chunk is in
+            elif closing and situation:
+                # The conversation is over: it becomes "last time", the next one starts fresh
+                state["last_session_summary"] = situation
+                situation = ""
+                save_summaries(situation, state["upto_seq"], state["last_session_summary"], user_id=user_id)
+            else:
+                save_summaries(situation, state["upto_seq"], user_id=user_id)
+            state["situation"] = situation
+            self.summarised += 1
+        return state
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending_users": len(self._pending), "summarised": self.summarised}
+
+
+summariser = SessionSummariser()
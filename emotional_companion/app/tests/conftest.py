@@ -0,0 +1,12 @@
+# The app modules import each other flat (run from emotional_companion/app)
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Nothing under test talks to a real Ollama or writes to the real memory dir
+os.environ.setdefault("INNER_VOICE_MEMORY_DIR", tempfile.mkdtemp(prefix="inner_voice_test_"))
+os.environ.setdefault("OLLAMA_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("INNER_VOICE_WARMUP", "0")
@@ -0,0 +1,59 @@
+import pytest
+
+from benchmark import REAL_WORD_SENTENCES
+from detectors import classify, is_english_word
+
+
+@pytest.mark.parametrize("message", [
+    "suicde",
+    "im thinking about sucide",
+    "i want to kil myself",
+    "I hurt myslf again",
+    "i cant go on",
+    "I want to end my lfe",
+])
+def test_misspelled_crisis_is_caught(message):
+    assert classify(message).crisis
+    assert not classify(message, fuzzy=False).crisis
+
+
+@pytest.mark.parametrize("message", ["my ex is blackmaling me", "he is threatning to leak my pics"])
+def test_misspelled_high_risk_is_caught(message):
+    assert classify(message).risk_level == "high"
+
+
+@pytest.mark.parametrize("message", [
+    "I think I overdone it at the gym",
+    "My mom overdone the rice",
+    "I want to dye my hair",
+    "and my life is good",
+    "the kiln is hot",
+])
+def test_real_words_never_raise_a_crisis(message):
+    signals = classify(message)
+    assert not signals.crisis
+    assert signals.risk_level == "normal"
+
+
+@pytest.mark.parametrize("sentence", REAL_WORD_SENTENCES)
+def test_real_words_are_not_corrected(sentence):
+    assert classify(sentence) == classify(sentence, fuzzy=False)
+
+
+@pytest.mark.parametrize("typo, field, expected", [
+    ("lonley", "emotion", "lonely"),
+    ("stresed", "distress", True),
+    ("exausted", "emotion", "tired"),
+    ("hopeles", "distress", True),
+    ("overwelmed", "distress", True),
+    ("anxous", "emotion", "anxious"),
+    ("frustated", "emotion", "angry"),
+])
+def test_common_misspellings_are_corrected(typo, field, expected):
+    assert not is_english_word(typo)
+    assert getattr(classify(f"I feel so {typo}"), field) == expected
+
+
+@pytest.mark.parametrize("word", ["overdone", "homeless", "exited", "excised", "imitated", "sleeps", "stopped"])
+def test_dictionary_knows_inflections(word):
+    assert is_english_word(word)
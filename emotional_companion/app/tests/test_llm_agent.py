@@ -0,0 +1,57 @@
+import time
+
+import benchmark
+import llm_agent
+import response_cache
+from llm_client import registry
+from scheduler import scheduler
+
+
+def _streamed(message, user_id):
+    stream = llm_agent.stream_analyze_and_respond(message, "", 3, None, user_id)
+    text = "".join(stream)
+    return stream, text
+
+
+class _Chain:
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+
+    def stream(self, input_data):
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield chunk
+
+
+def _use(chain, tmp_path, monkeypatch):
+    benchmark.setup_backend("offline", str(tmp_path))
+    registry.use_backend(chain)
+    monkeypatch.setattr(response_cache, "CACHE_ENABLED", False)
+
+
+def test_complete_reply_is_an_llm_turn(tmp_path, monkeypatch):
+    _use(_Chain(["That sounds heavy. ", "[EMOTION=sad]"]), tmp_path, monkeypatch)
+    assert llm_agent.run_turn("I feel down", "", 3, None, "u1").path == "llm"
+    assert _streamed("I feel down", "u1")[0].path == "llm"
+
+
+def test_reply_cut_by_the_token_cap_is_truncated(tmp_path, monkeypatch):
+    _use(_Chain(["That sounds heavy, and you have been carrying it"]), tmp_path, monkeypatch)
+    result = llm_agent.run_turn("I feel down", "", 3, None, "u2")
+    assert result.path == "llm_truncated"
+    assert result.emotion == "sad"  # falls back to the detected emotion
+    assert _streamed("I feel down", "u2")[0].path == "llm_truncated"
+
+
+def test_reply_cut_by_the_deadline_is_truncated(tmp_path, monkeypatch):
+    _use(_Chain(["That sounds ", "heavy. ", "[EMOTION=sad]"], delay=0.2), tmp_path, monkeypatch)
+    monkeypatch.setattr(llm_agent, "FIRST_TOKEN_DEADLINE", 0.0)
+    monkeypatch.setattr(llm_agent, "TURN_DEADLINE", 0.3)
+    stream, text = _streamed("I feel down", "u3")
+    assert stream.path == "llm_truncated"
+    assert stream.response == text.strip() == "That sounds"
+    # The late reply still finishes in the background; let it go before the next test
+    deadline = time.monotonic() + 3
+    while not scheduler.idle() and time.monotonic() < deadline:
+        time.sleep(0.01)
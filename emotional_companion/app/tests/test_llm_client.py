@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from llm_client import duration_seconds
+from warmup import WarmupManager
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("30m", 1800.0),
+    ("1h30m", 5400.0),
+    ("1.5h", 5400.0),
+    ("2m30s", 150.0),
+    ("500ms", 0.5),
+    ("300", 300.0),
+    (300, 300.0),
+    ("0", 0.0),
+    (0, 0.0),
+    ("-1", -1.0),
+    ("-1m", -60.0),
+])
+def test_duration_seconds(value, seconds):
+    assert duration_seconds(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", ["", "m", "10x", "1h 30m", "abc"])
+def test_duration_seconds_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        duration_seconds(value)
+
+
+def test_zero_keep_alive_is_never_kept_warm():
+    manager = WarmupManager(keep_alive="0")
+    assert manager.keep_alive == 0
+    assert not manager.applies
+    assert manager.ready()  # no cold path: there is nothing to wait for
+
+
+def test_negative_keep_alive_stays_loaded():
+    assert WarmupManager(keep_alive=-1).keep_alive == float("inf")
+    assert WarmupManager(keep_alive="1h30m").keep_alive == 5400.0
+
+
+def test_only_the_warmed_model_takes_the_cold_path(monkeypatch):
+    import llm_agent
+    import warmup as warmup_module
+    from metrics import metrics
+    from warmup import warmup
+
+    monkeypatch.setattr(warmup_module, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(warmup, "start", lambda: None)  # no background priming in tests
+    # A real Ollama, as far as warm-up can tell
+    monkeypatch.setattr(llm_agent.llm_registry, "_forced_chain", None)
+    monkeypatch.setattr(llm_agent.llm_registry, "_offline_only", False)
+    monkeypatch.setattr(warmup, "state", "cold")
+    before = metrics.snapshot()["counters"].get("llm_cold_turn", 0)
+
+    assert not llm_agent._model_cold("llama3.2:1b")
+    assert metrics.snapshot()["counters"].get("llm_cold_turn", 0) == before
+    assert llm_agent._model_cold(warmup.model)
+    assert metrics.snapshot()["counters"].get("llm_cold_turn", 0) == before + 1
+
+
+def test_first_routed_model_is_the_one_kept_warm():
+    from router import router
+    from warmup import warmup
+
+    assert warmup.model == router.models[0]
+
+
+class _SlowChain:
+    def stream(self, input_data):
+        time.sleep(0.3)
+        yield "Too late."
+
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_breaker_trial_is_released_when_the_call_is_cancelled(monkeypatch):
+    import llm_agent
+    from llm_client import registry
+    from scheduler import scheduler
+
+    assert _wait_for(scheduler.idle)  # no earlier call may settle the breaker under us
+    breaker = registry.breaker
+    monkeypatch.setattr(llm_agent, "FIRST_TOKEN_DEADLINE", 0.05)
+    monkeypatch.setattr(llm_agent, "LATE_REPLIES", "cancel")
+    breaker.state, breaker.opened_at = "open", time.time() - breaker.cooldown - 1
+    try:
+        assert breaker.allow() and breaker.state == "half_open"
+        call = llm_agent.LLMCall(_SlowChain(), {"phase": "understanding", "message": "hi"})
+        with pytest.raises(llm_agent.DeadlineMissed):
+            list(call.chunks())
+        # No outcome either way: the breaker stays open, and the next call is the new trial
+        assert _wait_for(lambda: breaker.state != "half_open")
+        assert breaker.state == "open"
+        assert breaker.allow() and breaker.state == "half_open"
+    finally:
+        breaker.record_success()
+
+
+def test_release_trial_leaves_a_closed_breaker_alone():
+    from llm_client import CircuitBreaker
+
+    breaker = CircuitBreaker()
+    breaker.release_trial()
+    assert breaker.state == "closed"
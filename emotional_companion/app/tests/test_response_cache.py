@@ -0,0 +1,29 @@
+import benchmark
+import response_cache
+from llm_agent import run_turn
+
+
+def test_repeated_message_from_one_user_hits_the_cache(tmp_path, monkeypatch):
+    benchmark.setup_backend("fake", str(tmp_path), fake={"first_token_delay": 0.0, "tokens_per_sec": 1e6})
+    monkeypatch.setattr(response_cache.response_cache, "explore", 0.0)
+    try:
+        first = run_turn("I am feeling lonely", "Name: Sam. ", 3, None, "sam")
+        # The turn in between changes recalled memory and the summaries, not the cache key
+        run_turn("Nobody texts me back anymore.", "Name: Sam. ", 4, None, "sam")
+        again = run_turn("I am feeling lonely", "Name: Sam. ", 5, None, "sam")
+    finally:
+        benchmark.setup_backend("offline", str(tmp_path))
+    assert first.path == "llm"
+    assert again.path == "cache"
+    assert again.response == first.response
+
+
+def test_cached_reply_is_not_shared_across_profiles(tmp_path, monkeypatch):
+    benchmark.setup_backend("fake", str(tmp_path), fake={"first_token_delay": 0.0, "tokens_per_sec": 1e6})
+    monkeypatch.setattr(response_cache.response_cache, "explore", 0.0)
+    try:
+        run_turn("I am feeling lonely", "Name: Sam. ", 3, None, "sam")
+        other = run_turn("I am feeling lonely", "Name: Alex. ", 3, None, "alex")
+    finally:
+        benchmark.setup_backend("offline", str(tmp_path))
+    assert other.path == "llm"
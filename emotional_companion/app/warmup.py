@@ -0,0 +1,136 @@
+# app/warmup.py - MODEL WARM-UP + KEEP-ALIVE
+# Ollama loads llama3 on the first request and unloads it after keep_alive of
+# idleness; on CPU that load takes many seconds on top of generation. This
+# manager primes the model from a background thread at app start (a one-token
+# chat call that also evaluates the static prompt prefix into Ollama's cache),
+# re-primes before keep_alive runs out while sessions are active, and tracks
+# warm/cold state so a turn never waits behind a model load it didn't need:
+# while the model is cold, turns are answered from the offline templates (or
+# wait, with INNER_VOICE_COLD_TURNS=wait) and warm-up is kicked off.
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from llm_client import KEEP_ALIVE, MODELS, duration_seconds, registry as llm_registry
+from metrics import inc, metrics
+
+WARMUP_ENABLED = os.getenv("INNER_VOICE_WARMUP", "1") != "0"
+COLD_TURNS = os.getenv("INNER_VOICE_COLD_TURNS", "offline")   # "offline" or "wait"
+ACTIVE_WINDOW = 15 * 60.0      # a session counts as active this long after its last turn
+REFRESH_SHARE = 0.5            # re-prime after this share of keep_alive has passed
+COLD_LOAD_MS = 500.0           # load_duration above this means the model was really loaded
+WARMUP_TIMEOUT = 300.0         # seconds; a CPU load can be slow
+RETRY_SECONDS = 30.0           # after a failed warm-up
+
+
+class WarmupManager:
+    def __init__(self, model: str = MODELS[0], keep_alive: Any = KEEP_ALIVE):
+        self.model = model
+        keep = duration_seconds(keep_alive)
+        # 0: Ollama unloads after every call, so nothing can be kept warm; < 0: never unloads
+        self.keep_alive = float("inf") if keep < 0 else keep
+        self.refresh = min(self.keep_alive * REFRESH_SHARE, ACTIVE_WINDOW)
+        self.state = "cold"            # "cold" -> "warming" -> "warm"
+        self.warm_until = 0.0
+        self.last_activity = 0.0
+        self.last_error = ""
+        self.cold_starts = 0
+        self.last_load_ms = 0.0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- turn side ----
+    def start(self) -> None:
+        """Begin warming in the background (idempotent)."""
+        if not WARMUP_ENABLED or not self.keep_alive or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self.last_activity = time.monotonic()
+                self._thread = threading.Thread(target=self._loop, name="ollama-warmup", daemon=True)
+                self._thread.start()
+
+    @property
+    def applies(self) -> bool:
+        """Warm/cold matters: warm-up is on, the model stays loaded and turns go to a real Ollama."""
+        return WARMUP_ENABLED and self.keep_alive > 0 and llm_registry.serves_ollama
+
+    def is_warm(self) -> bool:
+        return self.state == "warm" and time.monotonic() < self.warm_until
+
+    def ready(self) -> bool:
+        """
+        Should this turn call the model now? Always yes unless warm-up is on
+        and the model is cold; then warm-up is (re)started and the answer is
+        no under the default "offline" policy. Only for `self.model`; turns
+        on other models just call touch().
+        """
+        self.touch()
+        if not self.applies or self.is_warm() or llm_registry.breaker.state == "open":
+            return True  # (a server that is down is the circuit breaker's business, not "cold")
+        self.start()
+        self._wake.set()
+        inc("llm_cold_turn")
+        return COLD_TURNS == "wait"
+
+    def touch(self) -> None:
+        """A turn ran: sessions are active, so keep the model loaded."""
+        self.last_activity = time.monotonic()
+
+    def mark_used(self) -> None:
+        """A turn just reached the model, so it stays loaded for another keep_alive."""
+        with self._lock:
+            if self.state == "warm":
+                self.warm_until = time.monotonic() + self.keep_alive
+
+    # ---- background ----
+    def _loop(self) -> None:
+        while True:
+            now = time.monotonic()
+            active = now - self.last_activity < ACTIVE_WINDOW
+            due = not self.is_warm() or self.warm_until - now < self.keep_alive - self.refresh
+            if active and due and llm_registry.serves_ollama:
+                self.warm()
+            self._wake.wait(RETRY_SECONDS if self.state == "cold" else min(self.refresh, RETRY_SECONDS * 10))
+            self._wake.clear()
+
+    def warm(self) -> bool:
+        """One priming call; records whether it paid a model load."""
+        from llm_agent import PROMPT_PREFIX
+
+        with self._lock:
+            self.state = "warming" if not self.is_warm() else self.state
+        try:
+            timings = llm_registry.prime(PROMPT_PREFIX, self.model, WARMUP_TIMEOUT)
+        except Exception as e:
+            with self._lock:
+                self.state = "cold"
+                self.last_error = str(e)
+            inc("llm_warmup_failed")
+            return False
+        metrics.observe("llm_warmup", timings["wall_ms"])
+        if timings["load_ms"] >= COLD_LOAD_MS:
+            inc("llm_cold_start")
+            metrics.observe("llm_load", timings["load_ms"])
+        with self._lock:
+            if timings["load_ms"] >= COLD_LOAD_MS:
+                self.cold_starts += 1
+                self.last_load_ms = timings["load_ms"]
+            self.state = "warm"
+            self.warm_until = time.monotonic() + self.keep_alive
+            self.last_error = ""
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": "warm" if self.is_warm() else ("warming" if self.state == "warming" else "cold"),
+            "enabled": WARMUP_ENABLED,
+            "cold_starts": self.cold_starts,
+            "last_load_ms": round(self.last_load_ms, 1),
+            "last_error": self.last_error,
+        }
+
+
+warmup = WarmupManager()